@@ -0,0 +1,278 @@
+"""Versioned JSON API (/api/v1) over search, loans, borrowers and fines.
+
+For kiosks and sync jobs that would otherwise scrape the HTML pages.  It
+uses the same session login as the site: POST credentials to
+``/api/v1/session`` and send the cookie back.  Errors come back as
+``{"error": ...}`` with a 4xx status.
+
+* ``?fields=a,b`` on any endpoint returning a list trims each item to those
+  keys.
+* GET responses carry an ETag; a matching ``If-None-Match`` gets an empty
+  304 reply.
+* Batch endpoints take up to ``MAX_BATCH`` items and return one result per
+  item, in order, with ``error`` set on the ones that failed.
+"""
+from functools import wraps
+from typing import List
+
+from flask import Blueprint, jsonify, request, session
+
+import auth
+import borrowers
+import fines
+import loans
+import metrics
+import pagination
+import search
+import searchcache
+from db import get_db
+
+MAX_BATCH = 500
+
+bp = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+
+class ApiError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@bp.errorhandler(ApiError)
+def _api_error(error: ApiError):
+    return jsonify(error=error.message), error.status
+
+
+@bp.errorhandler(ValueError)
+def _value_error(error: ValueError):
+    return jsonify(error=str(error)), 400
+
+
+def _principal():
+    return auth.load_principal(get_db(), session.get("username")) if session.get("logged_in") else None
+
+
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if _principal() is None:
+            raise ApiError("Authentication required", 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def librarian_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        principal = _principal()
+        if principal is None:
+            raise ApiError("Authentication required", 401)
+        if not principal.is_librarian:
+            raise ApiError("Librarian access required", 403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _list_arg(name: str) -> List[str]:
+    """Values of a repeatable, comma-separable query argument (``?isbn=a,b&isbn=c``)."""
+    return [item.strip() for value in request.args.getlist(name) for item in value.split(",") if item.strip()]
+
+
+def _batch(values: list, name: str) -> list:
+    if not values:
+        raise ApiError(f"At least one {name} is required")
+    if len(values) > MAX_BATCH:
+        raise ApiError(f"At most {MAX_BATCH} {name}s per request")
+    return values
+
+
+def _json_body() -> dict:
+    """The request's JSON object; an empty one when there is no JSON body."""
+    body = request.get_json(silent=True)
+    if body is None:
+        return {}
+    if not isinstance(body, dict):
+        raise ApiError("Request body must be a JSON object")
+    return body
+
+
+def _json_list(body: dict, key: str) -> list:
+    values = body.get(key)
+    if not isinstance(values, list):
+        raise ApiError(f"'{key}' must be a list")
+    return _batch(values, key.rstrip("s"))
+
+
+def _isbns(values: list) -> List[str]:
+    if not all(isinstance(value, str) for value in values):
+        raise ApiError("ISBNs must be strings")
+    return values
+
+
+def _card_ids(values: list) -> List[int]:
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise ApiError("Card IDs must be integers")
+
+
+def _shape(items: List[dict]) -> List[dict]:
+    """Apply ``?fields=``: keep only the requested keys of each item."""
+    fields = _list_arg("fields")
+    if not fields or not items:
+        return items
+    unknown = [field for field in fields if field not in items[0]]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}")
+    return [{field: item[field] for field in fields} for item in items]
+
+
+def _reply(**body):
+    """JSON response; GETs get an ETag and honour If-None-Match."""
+    response = jsonify(**body)
+    if request.method == "GET":
+        response.add_etag()
+        response = response.make_conditional(request)
+    return response
+
+
+@bp.route("/session", methods=["POST"])
+def login():
+    body = _json_body()
+    username = body.get("username")
+    with get_db() as conn:
+        if not auth.verify_user(conn, username, body.get("password")):
+            raise ApiError("Invalid username or password", 401)
+    session["logged_in"] = True
+    session["username"] = username
+    return jsonify(username=username, role=_principal().role)
+
+
+@bp.route("/session", methods=["DELETE"])
+def logout():
+    session.clear()
+    return "", 204
+
+
+@bp.route("/search", methods=["GET"])
+@login_required
+def search_catalogue():
+    """One page of catalogue search results; follow ``next_cursor`` for more."""
+    query = request.args.get("q", "")
+    status = request.args.get("status", "all")
+    if status not in ("all", "available", "checked_out"):
+        raise ApiError("status must be all, available or checked_out")
+    per_page = request.args.get("per_page", search.SEARCH_PAGE_SIZE, type=int)
+    if not 1 <= per_page <= MAX_BATCH:
+        raise ApiError(f"per_page must be between 1 and {MAX_BATCH}")
+    with get_db() as conn:
+        page, mode = searchcache.search_page(conn, query, status, request.args.get("cursor"), per_page)
+    metrics.SEARCHES.inc(mode=mode)
+    results = [{key: value for key, value in row.items() if key != "Rank"} for row in page.rows]
+    return _reply(
+        query=query,
+        status=status,
+        page=page.number,
+        total=min(page.total, pagination.COUNT_CAP) if page.total is not None else None,
+        total_is_capped=page.total_is_capped,
+        next_cursor=page.next_cursor,
+        prev_cursor=page.prev_cursor,
+        results=_shape(results),
+    )
+
+
+@bp.route("/books/availability", methods=["GET", "POST"])
+@login_required
+def availability():
+    """Availability of many ISBNs: ``?isbn=a,b,c`` or ``{"isbns": [...]}``."""
+    if request.method == "POST":
+        isbns = _isbns(_json_list(_json_body(), "isbns"))
+    else:
+        isbns = _batch(_list_arg("isbn"), "isbn")
+    with get_db() as conn:
+        results = loans.book_availability(conn, isbns)
+    return _reply(results=_shape(results))
+
+
+@bp.route("/loans", methods=["GET"])
+@librarian_required
+def open_loans():
+    """Open loans by ``card_id``, ``isbn`` or ``borrower`` (name substring)."""
+    card_id = request.args.get("card_id")
+    with get_db() as conn:
+        results = loans.find_open_loans(
+            conn,
+            isbn=request.args.get("isbn"),
+            card_id=_card_ids([card_id])[0] if card_id else None,
+            borrower_name=request.args.get("borrower"),
+        )
+    return _reply(results=_shape(results))
+
+
+@bp.route("/loans", methods=["POST"])
+@librarian_required
+def checkout():
+    """Check out ``{"isbns": [...]}`` to ``card_id``; ``all_or_nothing`` cancels on any failure."""
+    body = _json_body()
+    isbns = _isbns(_json_list(body, "isbns"))
+    if body.get("card_id") is None:
+        raise ApiError("card_id is required")
+    card_id = _card_ids([body["card_id"]])[0]
+    with get_db() as conn:
+        results = loans.checkout_many(
+            conn, isbns, card_id,
+            override_restrictions=_principal().is_superuser,
+            all_or_nothing=bool(body.get("all_or_nothing")),
+        )
+    checked_out = sum(1 for result in results if not result["error"])
+    metrics.CHECKOUTS.inc(checked_out, outcome="ok")
+    metrics.CHECKOUTS.inc(len(results) - checked_out, outcome="error")
+    return jsonify(results=_shape(results))
+
+
+@bp.route("/loans/checkin", methods=["POST"])
+@librarian_required
+def checkin():
+    """Check in ``{"loan_ids": [...]}``; valid loans close even if others fail."""
+    body = _json_body()
+    try:
+        loan_ids = [int(loan_id) for loan_id in _json_list(body, "loan_ids")]
+    except (TypeError, ValueError):
+        raise ApiError("Loan IDs must be integers")
+    with get_db() as conn:
+        results = loans.checkin_many(conn, loan_ids)
+    checked_in = sum(1 for result in results if not result["error"])
+    metrics.CHECKINS.inc(checked_in, outcome="ok")
+    metrics.CHECKINS.inc(len(results) - checked_in, outcome="error")
+    return jsonify(results=_shape(results))
+
+
+@bp.route("/borrowers", methods=["GET", "POST"])
+@librarian_required
+def lookup_borrowers():
+    """Borrowers by card: ``?card_id=1,2,3`` or ``{"card_ids": [...]}``."""
+    if request.method == "POST":
+        card_ids = _card_ids(_json_list(_json_body(), "card_ids"))
+    else:
+        card_ids = _card_ids(_batch(_list_arg("card_id"), "card_id"))
+    with get_db() as conn:
+        results = borrowers.get_borrowers(conn, card_ids)
+    return _reply(results=_shape(results))
+
+
+@bp.route("/fines", methods=["GET"])
+@librarian_required
+def outstanding_fines():
+    """Unpaid fines per borrower."""
+    with get_db() as conn:
+        results = fines.list_outstanding_fines(conn)
+    return _reply(results=_shape(results))
+
+
+@bp.route("/fines/<int:card_id>/pay", methods=["POST"])
+@librarian_required
+def pay_fines(card_id):
+    with get_db() as conn:
+        fines.pay_fines(conn, card_id)
+    return jsonify(card_id=card_id, paid=True)
@@ -1,31 +1,45 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, Response, jsonify, render_template, request, redirect, url_for, flash, session, g
 from functools import wraps
-from db import get_connection
+import db
+from db import get_connection, get_db
 import search
+import searchcache
+import suggest
 import loans
 import borrowers
 import fines
 import auth
+import pagination
+import load_data
+import querystats
+import metrics
+import api
 
 app = Flask(__name__)
 app.secret_key = 'library_secret_key_change_in_production'  # Change this in production!
+pool = db.init_app(app)
+metrics.init_app(app, pool)
+app.register_blueprint(api.bp)
 
 # Initialize default admin user on startup
-with get_connection() as conn:
+with get_connection(profile=app.config['DB_PROFILE']) as conn:
+    db.print_profile_check(conn, app.config['DB_PROFILE'])
     auth.initialize_default_user(conn)
+    load_data.migrate(conn)
+    suggest.INDEX.build(conn)
+
+def current_principal():
+    """Return the logged-in user's auth.Principal, loaded once per request."""
+    if 'principal' not in g:
+        g.principal = auth.load_principal(get_db(), session.get('username'))
+    return g.principal
 
 # Context processor to make user info available in all templates
 @app.context_processor
 def inject_user_info():
-    username = session.get('username')
-    user_role = None
-    is_super = False
-    if username:
-        with get_connection() as conn:
-            user_info = auth.get_user_info(conn, username)
-            if user_info:
-                user_role = user_info.get('Role')
-                is_super = auth.is_superuser(conn, username)
+    principal = current_principal()
+    user_role = principal.role if principal else None
+    is_super = principal.is_superuser if principal else False
     return dict(user_role=user_role, is_superuser=is_super)
 
 def login_required(f):
@@ -43,7 +57,7 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        with get_connection() as conn:
+        with get_db() as conn:
             if auth.verify_user(conn, username, password):
                 session['logged_in'] = True
                 session['username'] = username
@@ -71,7 +85,7 @@ def register():
             flash('SSN, full name, and address are required.', 'error')
         else:
             try:
-                with get_connection() as conn:
+                with get_db() as conn:
                     # Create borrower account with user-provided SSN
                     card_id = borrowers.create_borrower(conn, ssn, full_name, address, phone)
                     
@@ -96,12 +110,10 @@ def logout():
 @app.route('/profile')
 @login_required
 def profile():
-    username = session.get('username')
+    principal = current_principal()
+    user_info = principal.info if principal else None
     
-    with get_connection() as conn:
-        # Get user info
-        user_info = auth.get_user_info(conn, username)
-        
+    with get_db() as conn:
         # Get active loans if user has a card_id
         active_loans = []
         outstanding_fines = []
@@ -134,10 +146,8 @@ def profile():
             total_fines = sum(f['Fine_amt'] for f in outstanding_fines)
     
     # Get user role
-    user_role = user_info.get('Role') if user_info else None
-    is_super = False
-    with get_connection() as conn:
-        is_super = auth.is_superuser(conn, username)
+    user_role = principal.role if principal else None
+    is_super = principal.is_superuser if principal else False
     
     return render_template('profile.html', 
                          user=user_info, 
@@ -160,7 +170,7 @@ def link_borrower():
     try:
         card_id = int(card_id)
         
-        with get_connection() as conn:
+        with get_db() as conn:
             # Check if borrower exists
             borrower = conn.execute(
                 "SELECT Card_id, Bname FROM BORROWER WHERE Card_id = ?",
@@ -187,6 +197,7 @@ def link_borrower():
                 (card_id, username)
             )
             conn.commit()
+            auth.invalidate_principal(username)
             
             flash(f'Successfully linked to borrower account: {borrower["Bname"]} (Card ID: {card_id})', 'success')
     except ValueError:
@@ -199,130 +210,67 @@ def link_borrower():
 @app.route('/')
 @login_required
 def index():
-    username = session.get('username')
-    with get_connection() as conn:
-        user_info = auth.get_user_info(conn, username)
-        if user_info and user_info.get('Role') == 'borrower':
-            return redirect(url_for('borrower_homepage'))
+    principal = current_principal()
+    if principal and principal.is_borrower:
+        return redirect(url_for('borrower_homepage'))
     # Get user role for template
-    username = session.get('username')
-    user_role = None
-    is_super = False
-    with get_connection() as conn:
-        user_info = auth.get_user_info(conn, username)
-        if user_info:
-            user_role = user_info.get('Role')
-            is_super = auth.is_superuser(conn, username)
+    user_role = principal.role if principal else None
+    is_super = principal.is_superuser if principal else False
     
     return render_template('index.html', user_role=user_role, is_superuser=is_super)
 
 def librarian_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        username = session.get('username')
-        with get_connection() as conn:
-            user_info = auth.get_user_info(conn, username)
-            if not user_info or user_info.get('Role') not in ['librarian', 'superuser']:
-                flash('Access denied. This page is for librarians only.', 'error')
-                return redirect(url_for('borrower_homepage' if auth.is_borrower(conn, username) else 'index'))
+        principal = current_principal()
+        if not principal or not principal.is_librarian:
+            flash('Access denied. This page is for librarians only.', 'error')
+            return redirect(url_for('borrower_homepage' if principal and principal.is_borrower else 'index'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def superuser_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        principal = current_principal()
+        if not principal or not principal.is_superuser:
+            flash('Access denied. This page is for superusers only.', 'error')
+            return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
 
+@app.route('/api/suggest', methods=['GET'])
+@login_required
+def suggest_catalogue():
+    """Typeahead: titles, ISBNs and author names starting with ?q=, as JSON."""
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', suggest.SUGGEST_LIMIT, type=int)
+    limit = max(0, min(limit, suggest.MAX_SUGGEST_LIMIT))
+    if suggest.INDEX.due():
+        suggest.INDEX.refresh(get_db())
+    return jsonify(query=query, suggestions=suggest.INDEX.suggest(query, limit))
+
 @app.route('/search', methods=['GET'])
 @login_required
 def search_books():
     query = request.args.get('q', '')
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     status_filter = request.args.get('status', 'all')  # all, available, checked_out
-    per_page = 50
-    offset = (page - 1) * per_page
     
-    results = []
-    total_count = 0
-    
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Build WHERE clause based on filters
-        where_conditions = []
-        params = []
-        
-        if query:
-            # Search in ISBN, Title, or Author
-            where_conditions.append("(LOWER(b.Isbn) LIKE ? OR LOWER(b.Title) LIKE ? OR LOWER(a.Name) LIKE ?)")
-            search_term = f"%{query.lower()}%"
-            params.extend([search_term, search_term, search_term])
-        
-        # Status filter
-        if status_filter == 'available':
-            where_conditions.append("NOT EXISTS (SELECT 1 FROM BOOK_LOANS bl WHERE bl.Isbn = b.Isbn AND bl.Date_in IS NULL)")
-        elif status_filter == 'checked_out':
-            where_conditions.append("EXISTS (SELECT 1 FROM BOOK_LOANS bl WHERE bl.Isbn = b.Isbn AND bl.Date_in IS NULL)")
-        
-        where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
-        
-        # Get total count for pagination
-        count_query = f"""
-            SELECT COUNT(DISTINCT b.Isbn)
-            FROM BOOK b
-            LEFT JOIN BOOK_AUTHORS ba ON b.Isbn = ba.Isbn
-            LEFT JOIN AUTHORS a ON ba.Author_id = a.Author_id
-            {where_clause}
-        """
-        total_count = cursor.execute(count_query, params).fetchone()[0]
-        
-        # Get paginated results with Borrower ID
-        # Use subquery for authors to avoid DISTINCT issue with GROUP_CONCAT in SQLite
-        # Keep JOINs in FROM clause for WHERE conditions, but use subquery for author aggregation
-        results_query = f"""
-            SELECT DISTINCT
-                b.Isbn,
-                b.Title,
-                COALESCE((
-                    SELECT GROUP_CONCAT(a2.Name, ', ')
-                    FROM BOOK_AUTHORS ba2
-                    JOIN AUTHORS a2 ON ba2.Author_id = a2.Author_id
-                    WHERE ba2.Isbn = b.Isbn
-                ), '') AS Authors,
-                CASE
-                    WHEN EXISTS (
-                        SELECT 1 FROM BOOK_LOANS bl WHERE bl.Isbn = b.Isbn AND bl.Date_in IS NULL
-                    ) THEN 'OUT'
-                    ELSE 'IN'
-                END AS Status,
-                (SELECT bl.Card_id 
-                 FROM BOOK_LOANS bl 
-                 WHERE bl.Isbn = b.Isbn AND bl.Date_in IS NULL 
-                 ORDER BY bl.Loan_id DESC
-                 LIMIT 1) AS Borrower_ID
-            FROM BOOK b
-            LEFT JOIN BOOK_AUTHORS ba ON b.Isbn = ba.Isbn
-            LEFT JOIN AUTHORS a ON ba.Author_id = a.Author_id
-            {where_clause}
-            ORDER BY b.Title
-            LIMIT ? OFFSET ?
-        """
-        cursor.execute(results_query, params + [per_page, offset])
-        results = [dict(row) for row in cursor.fetchall()]
-    
-    total_pages = (total_count + per_page - 1) // per_page
+    with get_db() as conn:
+        page, search_mode = searchcache.search_page(conn, query, status_filter, cursor)
+    metrics.SEARCHES.inc(mode=search_mode)
     
     # Get user role for template
-    username = session.get('username')
-    user_role = None
-    is_super = False
-    with get_connection() as conn:
-        user_info = auth.get_user_info(conn, username)
-        if user_info:
-            user_role = user_info.get('Role')
-            is_super = auth.is_superuser(conn, username)
+    principal = current_principal()
+    user_role = principal.role if principal else None
+    is_super = principal.is_superuser if principal else False
     
     return render_template('search.html', 
-                         results=results, 
+                         results=page.rows, 
                          query=query,
                          page=page,
-                         total_pages=total_pages,
-                         total_count=total_count,
+                         count_cap=pagination.COUNT_CAP,
                          status_filter=status_filter,
                          user_role=user_role,
                          is_superuser=is_super)
@@ -340,10 +288,18 @@ def view_loans():
                 try:
                     # Convert strings to ints
                     ids = [int(x) for x in loan_ids]
-                    with get_connection() as conn:
-                        loans.checkin_multiple(conn, ids)
-                    flash(f"Successfully checked in {len(loan_ids)} book(s).", "success")
+                    with get_db() as conn:
+                        results = loans.checkin_many(conn, ids)
+                    checked_in = sum(1 for result in results if not result['error'])
+                    metrics.CHECKINS.inc(checked_in, outcome="ok")
+                    metrics.CHECKINS.inc(len(results) - checked_in, outcome="error")
+                    if checked_in:
+                        flash(f"Successfully checked in {checked_in} book(s).", "success")
+                    for result in results:
+                        if result['error']:
+                            flash(f"Loan {result['loan_id']}: {result['error']}", "error")
                 except Exception as e:
+                    metrics.CHECKINS.inc(len(loan_ids), outcome="error")
                     flash(str(e), "error")
         return redirect(url_for('view_loans'))
 
@@ -353,7 +309,7 @@ def view_loans():
     open_loans = []
     
     if search_term:
-        with get_connection() as conn:
+        with get_db() as conn:
             try:
                 if search_type == 'card_id':
                      open_loans = loans.find_open_loans(conn, card_id=search_term)
@@ -365,10 +321,8 @@ def view_loans():
                 pass # No filter or invalid filter
 
     # Get user role for template
-    username = session.get('username')
-    is_super = False
-    with get_connection() as conn:
-        is_super = auth.is_superuser(conn, username)
+    principal = current_principal()
+    is_super = principal.is_superuser if principal else False
     
     return render_template('loans.html', loans=open_loans, search_term=search_term, search_type=search_type, is_superuser=is_super)
 
@@ -384,12 +338,14 @@ def checkout_book():
         return redirect(url_for('view_loans'))
 
     try:
-        with get_connection() as conn:
+        with get_db() as conn:
             # Check if user is super-user
-            is_superuser = auth.is_superuser(conn, session.get('username'))
+            is_superuser = current_principal().is_superuser
             loans.checkout(conn, isbn, card_id, override_restrictions=is_superuser)
+        metrics.CHECKOUTS.inc(outcome="ok")
         flash(f"Book {isbn} checked out to Card {card_id}.", "success")
     except Exception as e:
+        metrics.CHECKOUTS.inc(outcome="error")
         flash(str(e), "error")
     
     return redirect(url_for('view_loans'))
@@ -406,18 +362,14 @@ def bulk_checkout():
         return redirect(url_for('search_books'))
 
     try:
-        with get_connection() as conn:
+        with get_db() as conn:
             # Check if user is super-user
-            is_superuser = auth.is_superuser(conn, session.get('username'))
-            success_count = 0
-            errors = []
-            
-            for isbn in isbns:
-                try:
-                    loans.checkout(conn, isbn, card_id, override_restrictions=is_superuser)
-                    success_count += 1
-                except Exception as e:
-                    errors.append(f"{isbn}: {str(e)}")
+            is_superuser = current_principal().is_superuser
+            results = loans.checkout_many(conn, isbns, card_id, override_restrictions=is_superuser)
+            success_count = sum(1 for result in results if not result['error'])
+            metrics.CHECKOUTS.inc(success_count, outcome="ok")
+            metrics.CHECKOUTS.inc(len(results) - success_count, outcome="error")
+            errors = [f"{result['isbn']}: {result['error']}" for result in results if result['error']]
             
             if success_count > 0:
                 flash(f"Successfully checked out {success_count} book(s) to Card {card_id}.", "success")
@@ -425,13 +377,14 @@ def bulk_checkout():
                 for error in errors:
                     flash(error, "error")
     except Exception as e:
+        metrics.CHECKOUTS.inc(len(isbns), outcome="error")
         flash(f"Error during bulk checkout: {str(e)}", "error")
     
     # Redirect back to search with current query parameters
     query = request.args.get('q', '')
-    page = request.args.get('page', '1')
+    cursor = request.args.get('cursor')
     status = request.args.get('status', 'all')
-    return redirect(url_for('search_books', q=query, page=page, status=status))
+    return redirect(url_for('search_books', q=query, cursor=cursor, status=status))
 
 @app.route('/borrowers', methods=['GET', 'POST'])
 @login_required
@@ -444,52 +397,31 @@ def manage_borrowers():
         phone = request.form.get('phone')
         
         try:
-            with get_connection() as conn:
+            with get_db() as conn:
                 new_id = borrowers.create_borrower(conn, ssn, name, address, phone)
             flash(f"Borrower created successfully! Card ID: {new_id}", "success")
             return redirect(url_for('manage_borrowers'))
         except Exception as e:
             flash(str(e), "error")
     
-    # Pagination
-    page = int(request.args.get('page', 1))
+    # Keyset pagination, newest Card_id first
+    cursor = request.args.get('cursor')
     per_page = 50
-    offset = (page - 1) * per_page
     
-    # Get all borrowers with pagination
-    all_borrowers = []
-    total_count = 0
-    
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        
-        # Get total count
-        total_count = cursor.execute("SELECT COUNT(*) FROM BORROWER").fetchone()[0]
-        
-        # Get paginated results
-        cursor.execute("""
-            SELECT Card_id, Ssn, Bname, Address, Phone
-            FROM BORROWER
-            ORDER BY Card_id DESC
-            LIMIT ? OFFSET ?
-        """, (per_page, offset))
-        all_borrowers = [dict(row) for row in cursor.fetchall()]
-    
-    total_pages = (total_count + per_page - 1) // per_page
+    with get_db() as conn:
+        page = pagination.paginate(
+            conn, "Card_id, Ssn, Bname, Address, Phone", "BORROWER", [], [],
+            [("Card_id", "Card_id")], per_page, cursor=cursor, descending=True,
+        )
     
     # Get current user's card_id
-    user_card_id = None
-    username = session.get('username')
-    with get_connection() as conn:
-        row = conn.execute("SELECT Card_id FROM USERS WHERE Username = ?", (username,)).fetchone()
-        if row:
-            user_card_id = row[0]
+    principal = current_principal()
+    user_card_id = principal.card_id if principal else None
 
     return render_template('borrowers.html', 
-                         borrowers=all_borrowers,
+                         borrowers=page.rows,
                          page=page,
-                         total_pages=total_pages,
-                         total_count=total_count,
+                         count_cap=pagination.COUNT_CAP,
                          user_card_id=user_card_id)
 
 @app.route('/borrowers/delete/<int:card_id>', methods=['POST'])
@@ -497,16 +429,11 @@ def manage_borrowers():
 @librarian_required
 def delete_borrower(card_id):
     try:
-        username = session.get('username')
+        principal = current_principal()
         
-        with get_connection() as conn:
+        with get_db() as conn:
             # Check if this borrower belongs to the current user
-            user_card_id = conn.execute(
-                "SELECT Card_id FROM USERS WHERE Username = ?",
-                (username,)
-            ).fetchone()
-            
-            if user_card_id and user_card_id[0] == card_id:
+            if principal and principal.card_id == card_id:
                 flash("You cannot delete your own borrower account.", "error")
                 return redirect(url_for('manage_borrowers'))
             
@@ -525,6 +452,7 @@ def delete_borrower(card_id):
                 # Delete borrower
                 conn.execute("DELETE FROM BORROWER WHERE Card_id = ?", (card_id,))
                 conn.commit()
+                auth.invalidate_principal()
                 flash(f"Borrower {card_id} deleted successfully.", "success")
     except Exception as e:
         flash(f"Error deleting borrower: {str(e)}", "error")
@@ -538,9 +466,10 @@ def unlink_borrower():
     username = session.get('username')
     
     try:
-        with get_connection() as conn:
+        with get_db() as conn:
             conn.execute("UPDATE USERS SET Card_id = NULL WHERE Username = ?", (username,))
             conn.commit()
+            auth.invalidate_principal(username)
             flash("Borrower account unlinked successfully. You can now link a new account.", "success")
     except Exception as e:
         flash(f"Error unlinking borrower: {str(e)}", "error")
@@ -551,15 +480,15 @@ def unlink_borrower():
 @login_required
 def borrower_homepage():
     """Borrower homepage - allows borrowers to view their checkouts and search books"""
-    username = session.get('username')
+    principal = current_principal()
     
-    with get_connection() as conn:
+    with get_db() as conn:
         # Verify user is a borrower
-        if not auth.is_borrower(conn, username):
+        if not principal or not principal.is_borrower:
             flash('Access denied. This page is for borrowers only.', 'error')
             return redirect(url_for('index'))
         
-        user_info = auth.get_user_info(conn, username)
+        user_info = principal.info
         active_loans = []
         outstanding_fines = []
         total_fines = 0
@@ -604,13 +533,14 @@ def manage_fines():
     if request.method == 'POST':
         action = request.form.get('action')
         if action == 'refresh':
-            with get_connection() as conn:
-                fines.refresh_fines(conn)
+            with get_db() as conn:
+                written = fines.refresh_fines(conn, incremental=True)
+            metrics.FINES_REFRESHED.inc(written)
             flash("Fines refreshed successfully.", "success")
         elif action == 'pay':
             card_id = request.form.get('card_id')
             try:
-                with get_connection() as conn:
+                with get_db() as conn:
                     fines.pay_fines(conn, card_id)
                 flash(f"Fines paid for Card ID {card_id}.", "success")
             except Exception as e:
@@ -622,7 +552,7 @@ def manage_fines():
     outstanding = []
     all_fines = []
     
-    with get_connection() as conn:
+    with get_db() as conn:
         outstanding = fines.list_outstanding_fines(conn)
         
         if show_paid:
@@ -647,5 +577,16 @@ def manage_fines():
                          fines=outstanding if not show_paid else all_fines,
                          show_paid=show_paid)
 
+@app.route('/admin/query-stats')
+@login_required
+@superuser_required
+def query_stats():
+    """Top statements by total time since startup, as plain text."""
+    limit = request.args.get('limit', 20, type=int)
+    order_by = request.args.get('order', 'total_ms')
+    if order_by not in ('total_ms', 'calls', 'mean_ms', 'max_ms', 'rows'):
+        order_by = 'total_ms'
+    return Response(querystats.STATS.report(limit, order_by), mimetype='text/plain')
+
 if __name__ == '__main__':
     app.run(debug=True)
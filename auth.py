@@ -1,6 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+
 from werkzeug.security import generate_password_hash, check_password_hash
 from db import db_transaction
 
+ROLES = ('librarian', 'borrower', 'superuser')
+
+# Principals are cached per process for a short time so that a page view
+# resolves the user's role once.  Writes to USERS made through this module
+# (or through invalidate_principal) evict the affected entries immediately.
+PRINCIPAL_TTL = 30.0
+PRINCIPAL_CACHE_SIZE = 1024
+
+_principal_cache = OrderedDict()
+_principal_lock = threading.Lock()
+
+
+class Principal:
+    """The logged-in user's identity and role, resolved once per request."""
+
+    __slots__ = ('username', 'role', 'card_id', 'info')
+
+    def __init__(self, info: dict):
+        self.username = info['Username']
+        self.role = info.get('Role')
+        self.card_id = info.get('Card_id')
+        self.info = info
+
+    @property
+    def is_superuser(self) -> bool:
+        return self.role == 'superuser'
+
+    @property
+    def is_borrower(self) -> bool:
+        return self.role == 'borrower'
+
+    @property
+    def is_librarian(self) -> bool:
+        """Librarian privileges, which superusers also hold."""
+        return self.role in ('librarian', 'superuser')
+
 def create_user(conn, username: str, password: str, card_id: int = None, role: str = 'librarian') -> int:
     """Create a new user with hashed password."""
     username = (username or "").strip()
@@ -12,7 +52,7 @@ def create_user(conn, username: str, password: str, card_id: int = None, role: s
     if len(password) < 4:
         raise ValueError("Password must be at least 4 characters")
     
-    if role not in ['librarian', 'borrower', 'superuser']:
+    if role not in ROLES:
         role = 'librarian'
     
     password_hash = generate_password_hash(password)
@@ -26,7 +66,8 @@ def create_user(conn, username: str, password: str, card_id: int = None, role: s
             "INSERT INTO USERS (Username, Password, Card_id, Role) VALUES (?, ?, ?, ?)",
             (username, password_hash, card_id, role)
         )
-        return cursor.lastrowid
+    invalidate_principal(username)
+    return cursor.lastrowid
 
 def verify_user(conn, username: str, password: str) -> bool:
     """Verify user credentials."""
@@ -60,6 +101,49 @@ def get_user_info(conn, username: str) -> dict:
     
     return dict(row) if row else None
 
+def load_principal(conn, username: str):
+    """Return the cached Principal for ``username``, querying USERS on a miss."""
+    if not username:
+        return None
+    now = time.monotonic()
+    with _principal_lock:
+        entry = _principal_cache.get(username)
+        if entry and entry[0] > now:
+            _principal_cache.move_to_end(username)
+            return entry[1]
+
+    info = get_user_info(conn, username)
+    if not info:
+        return None
+    principal = Principal(info)
+    with _principal_lock:
+        _principal_cache[username] = (now + PRINCIPAL_TTL, principal)
+        _principal_cache.move_to_end(username)
+        while len(_principal_cache) > PRINCIPAL_CACHE_SIZE:
+            _principal_cache.popitem(last=False)
+    return principal
+
+def invalidate_principal(username: str = None) -> None:
+    """Drop one cached principal, or all of them when no username is given."""
+    with _principal_lock:
+        if username is None:
+            _principal_cache.clear()
+        else:
+            _principal_cache.pop(username, None)
+
+def set_role(conn, username: str, role: str) -> None:
+    """Change a user's role."""
+    if role not in ROLES:
+        raise ValueError(f"Role must be one of: {', '.join(ROLES)}")
+    with db_transaction(conn):
+        updated = conn.execute(
+            "UPDATE USERS SET Role = ? WHERE Username = ?",
+            (role, username)
+        )
+        if updated.rowcount == 0:
+            raise ValueError("User not found")
+    invalidate_principal(username)
+
 def is_superuser(conn, username: str) -> bool:
     """Check if user is a superuser."""
     if not username:
@@ -113,6 +197,7 @@ def initialize_default_user(conn):
             try:
                 conn.execute("UPDATE USERS SET Role = 'superuser' WHERE Username = 'admin'")
                 conn.commit()
+                invalidate_principal('admin')
             except:
                 pass
     except Exception as e:
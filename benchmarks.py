@@ -0,0 +1,587 @@
+"""Benchmarks for the library's hot paths.
+
+Each benchmark builds its own synthetic database in a temporary directory,
+so the real ``library.db`` is never touched.
+
+    python benchmarks.py fines --loans 1000000
+    python benchmarks.py normalize --rows 1000000 --workers 4
+    python benchmarks.py borrowers --rows 5000000
+    python benchmarks.py suite --save          # record baselines
+    python benchmarks.py suite                 # fail on regressions
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+import fines
+import load_data
+import loans
+import normalize
+import search
+import synthetic
+from db import get_connection, db_transaction
+from load_data import create_indexes
+
+SCHEMA_FILE = Path("schema.sql")
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def _create_database(path: Path):
+    conn = get_connection(path, profile="default")
+    conn.executescript(SCHEMA_FILE.read_text(encoding="utf-8"))
+    create_indexes(conn)
+    return conn
+
+
+def build_loan_history(conn, loans: int, today: date, seed: int = 42,
+                       books: int = 20000, borrowers: int = 5000) -> None:
+    """Fill BOOK_LOANS with ``loans`` rows spread over roughly three years.
+
+    About 2% of loans are still open, a quarter of returns are late, and
+    some of the resulting fines are already paid so the upsert has to
+    leave them alone.
+    """
+    rng = random.Random(seed)
+    conn.executemany(
+        "INSERT INTO BOOK(Isbn, Title) VALUES (?, ?)",
+        ((f"{i:010d}", f"Title {i}") for i in range(books)),
+    )
+    conn.executemany(
+        "INSERT INTO BORROWER(Card_id, Ssn, Bname, Address, Phone) VALUES (?, ?, ?, ?, NULL)",
+        ((i, f"{i:09d}", f"Borrower {i}", "1 Main St") for i in range(1, borrowers + 1)),
+    )
+
+    def rows():
+        for loan_id in range(1, loans + 1):
+            date_out = today - timedelta(days=rng.randint(0, 3 * 365))
+            due = date_out + timedelta(days=14)
+            roll = rng.random()
+            if roll < 0.02:
+                date_in = None
+            elif roll < 0.27:
+                date_in = due + timedelta(days=rng.randint(1, 60))
+            else:
+                date_in = date_out + timedelta(days=rng.randint(0, 14))
+            if date_in is not None and date_in > today:
+                date_in = today
+            yield (
+                loan_id,
+                f"{rng.randrange(books):010d}",
+                rng.randint(1, borrowers),
+                date_out.isoformat(),
+                due.isoformat(),
+                date_in.isoformat() if date_in else None,
+            )
+
+    conn.executemany(
+        "INSERT INTO BOOK_LOANS(Loan_id, Isbn, Card_id, Date_out, Due_date, Date_in) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        rows(),
+    )
+    # Pre-existing fines: a stale unpaid amount to overwrite and paid ones to keep.
+    conn.execute(
+        """
+        INSERT INTO FINES(Loan_id, Fine_amt, Paid)
+        SELECT Loan_id, 0.25, Loan_id % 2
+        FROM BOOK_LOANS
+        WHERE Date_in > Due_date AND Loan_id % 10 = 0
+        """
+    )
+    conn.commit()
+
+
+def legacy_refresh_fines(conn, today: date) -> None:
+    """The original row-at-a-time implementation, kept as the reference result."""
+    rows = conn.execute(
+        """
+        SELECT Loan_id, Due_date, Date_in
+        FROM BOOK_LOANS
+        WHERE Due_date < :today
+          AND (Date_in IS NULL OR Date_in > Due_date)
+        """,
+        {"today": today.isoformat()},
+    ).fetchall()
+
+    with db_transaction(conn):
+        for row in rows:
+            due_date = date.fromisoformat(row["Due_date"])
+            end_date = date.fromisoformat(row["Date_in"]) if row["Date_in"] else today
+            days_late = (end_date - due_date).days
+            if days_late <= 0:
+                continue
+            fine_amt = round(days_late * fines.DAILY_FINE, 2)
+            existing = conn.execute(
+                "SELECT Paid FROM FINES WHERE Loan_id = ?", (row["Loan_id"],)
+            ).fetchone()
+            if existing:
+                if existing["Paid"]:
+                    continue
+                conn.execute(
+                    "UPDATE FINES SET Fine_amt = ? WHERE Loan_id = ? AND Paid = 0",
+                    (fine_amt, row["Loan_id"]),
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO FINES (Loan_id, Fine_amt, Paid) VALUES (?, ?, 0)",
+                    (row["Loan_id"], fine_amt),
+                )
+
+
+def _fines_snapshot(conn):
+    return conn.execute("SELECT Loan_id, Fine_amt, Paid FROM FINES ORDER BY Loan_id").fetchall()
+
+
+def bench_fines(loans: int, seed: int) -> None:
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = Path(tmp) / "legacy.db"
+        current_path = Path(tmp) / "current.db"
+
+        conn = _create_database(legacy_path)
+        elapsed, _ = _timed(build_loan_history, conn, loans, today, seed)
+        conn.close()
+        shutil.copy(legacy_path, current_path)
+        print(f"Built {loans:,} loans in {elapsed:.1f}s")
+
+        legacy = get_connection(legacy_path, profile="default")
+        legacy_time, _ = _timed(legacy_refresh_fines, legacy, today)
+
+        current = get_connection(current_path, profile="default")
+        current_time, written = _timed(fines.refresh_fines, current, today)
+
+        same = [tuple(r) for r in _fines_snapshot(legacy)] == [tuple(r) for r in _fines_snapshot(current)]
+        legacy.close()
+
+        # Next day: a few returns, then an incremental refresh from the
+        # watermark versus a full rescan on an identical copy.
+        tomorrow = today + timedelta(days=1)
+        current.execute(
+            "UPDATE BOOK_LOANS SET Date_in = ? WHERE Date_in IS NULL AND Loan_id % 7 = 0",
+            (tomorrow.isoformat(),),
+        )
+        current.commit()
+        current.close()
+        full_path = Path(tmp) / "full.db"
+        shutil.copy(current_path, full_path)
+
+        current = get_connection(current_path, profile="default")
+        incremental_time, _ = _timed(fines.refresh_fines, current, tomorrow, incremental=True)
+        full = get_connection(full_path, profile="default")
+        full_time, _ = _timed(fines.refresh_fines, full, tomorrow)
+        same_incremental = [tuple(r) for r in _fines_snapshot(current)] == [tuple(r) for r in _fines_snapshot(full)]
+        current.close()
+        full.close()
+
+    print(f"row-by-row refresh_fines: {legacy_time:8.3f}s")
+    print(f"set-based refresh_fines:  {current_time:8.3f}s ({written:,} fines written)")
+    print(f"speedup: {legacy_time / current_time:.1f}x")
+    print(f"results identical: {'yes' if same else 'NO'}")
+    print(f"next-day full refresh:        {full_time:8.3f}s")
+    print(f"next-day incremental refresh: {incremental_time:8.3f}s")
+    print(f"incremental matches full: {'yes' if same_incremental else 'NO'}")
+    if not (same and same_incremental):
+        raise SystemExit(1)
+
+
+def write_synthetic_books(path: Path, rows: int, seed: int = 42, authors: int = 50000) -> None:
+    """Write a tab-separated books file in the raw publisher-feed layout."""
+    rng = random.Random(seed)
+    names = [f"Author {i} {rng.choice(['Smith', 'Lee', 'Garcia', 'Nguyen', 'Okafor'])}" for i in range(authors)]
+    with path.open("w", encoding="utf-8", newline="") as handle:
+        handle.write("ISBN10\tISBN13\tTitle\tAuthor\tCover\tPublisher\tPages\n")
+        for i in range(rows):
+            # Repeat some ISBNs and vary author spacing/case so dedupe is exercised.
+            isbn = f"{rng.randrange(rows):010d}" if i % 50 == 0 else f"{i:010d}"
+            book_authors = ",".join(
+                rng.choice(names).upper() if rng.random() < 0.05 else rng.choice(names)
+                for _ in range(rng.randint(1, 3))
+            )
+            handle.write(
+                f"{isbn}\t978{isbn}\tthe book of {rng.randrange(10 ** 6)}\t{book_authors}\t"
+                f"http://covers.example/{isbn}.jpg\tPublisher {rng.randrange(500)}\t{rng.randint(50, 900)}\n"
+            )
+
+
+def _digest(paths) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+# Repeated ISBNs whose rows land in different chunks or shards; the second
+# copy of 0000000001 brings an author seen nowhere else.
+SPLIT_DUPLICATES_FEED = (
+    "ISBN10\tISBN13\tTitle\tAuthor\n"
+    "0000000001\t9780000000001\talpha\tAnn Early\n"
+    "0000000002\t9780000000002\tbeta\tBob Second\n"
+    "0000000001\t9780000000001\talpha\tAnn Early,Late Coauthor\n"
+    "0000000003\t9780000000003\tgamma\tCy Third\n"
+    "0000000002\t9780000000002\tbeta\tbob  second\n"
+)
+
+
+def _normalize_digest(source: Path, directory: Path, tag: str, **kwargs) -> str:
+    outputs = [directory / f"{name}_{tag}.csv" for name in ("book", "authors", "book_authors")]
+    _quietly(normalize.normalize_Books, str(source), str(outputs[0]),
+             authorsFile=str(outputs[1]), bookAuthorsFile=str(outputs[2]), **kwargs)
+    return _digest(outputs)
+
+
+def check_split_duplicates(directory: Path) -> bool:
+    """Chunked and sharded runs of SPLIT_DUPLICATES_FEED match the whole-file run."""
+    source = directory / "split_duplicates.csv"
+    source.write_text(SPLIT_DUPLICATES_FEED, encoding="utf-8")
+    whole = _normalize_digest(source, directory, "whole")
+    runs = [("chunksize", 1), ("chunksize", 2), ("workers", 2), ("workers", 3)]
+    return all(_normalize_digest(source, directory, f"{k}{v}", **{k: v}) == whole for k, v in runs)
+
+
+def bench_normalize(rows: int, max_workers: int, seed: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        same = check_split_duplicates(Path(tmp))
+        print(f"duplicate ISBNs split across chunks and shards: {'identical' if same else 'DIFFERS'}")
+        if not same:
+            raise SystemExit(1)
+        source = Path(tmp) / "books.csv"
+        elapsed, _ = _timed(write_synthetic_books, source, rows, seed)
+        print(f"Wrote {rows:,} raw book rows ({source.stat().st_size / 2 ** 20:.0f} MiB) in {elapsed:.1f}s")
+        print(f"CPUs available: {os.cpu_count()}")
+
+        baseline = None
+        serial_time = None
+        workers = 1
+        while workers <= max_workers:
+            outputs = [Path(tmp) / f"{name}_{workers}.csv" for name in ("book", "authors", "book_authors")]
+            elapsed, _ = _timed(
+                normalize.normalize_Books, str(source), str(outputs[0]),
+                authorsFile=str(outputs[1]), bookAuthorsFile=str(outputs[2]), workers=workers,
+            )
+            digest = _digest(outputs)
+            baseline = baseline or digest
+            serial_time = serial_time or elapsed
+            print(f"workers={workers:<3} {elapsed:8.2f}s  speedup {serial_time / elapsed:4.2f}x  "
+                  f"output {'identical' if digest == baseline else 'DIFFERS'}")
+            if digest != baseline:
+                raise SystemExit(1)
+            workers *= 2
+
+        chunksize = max(rows // 8, 1)
+        digest = _normalize_digest(source, Path(tmp), "chunked", chunksize=chunksize)
+        print(f"chunksize={chunksize:<7,} output {'identical' if digest == baseline else 'DIFFERS'}")
+        if digest != baseline:
+            raise SystemExit(1)
+
+
+def write_synthetic_borrowers(path: Path, rows: int, seed: int = 42) -> None:
+    """Write a borrowers file in the raw layout, with some address parts blank."""
+    rng = random.Random(seed)
+    cities = [("Plano", "TX"), ("Dallas", "TX"), ("Austin", "TX"), ("Tulsa", "OK"), ("", "")]
+    with path.open("w", encoding="utf-8", newline="") as handle:
+        handle.write("ID0000id,ssn,first_name,last_name,email,address,city,state,phone\n")
+        for i in range(1, rows + 1):
+            city, state = rng.choice(cities)
+            street = "" if rng.random() < 0.05 else f"{rng.randint(1, 9999)} Main Street"
+            handle.write(
+                f"ID{i:06d},{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)},"
+                f"first{i % 997},last{i % 991},b{i}@example.com,{street},{city},{state},"
+                f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}\n"
+            )
+
+
+def legacy_prepare_borrowers(df):
+    """The original row-wise address assembly, kept as the reference result."""
+    df = df.rename(columns={
+        "ID0000id": "Card_id", "ssn": "Ssn", "first_name": "first_name", "last_name": "last_name",
+        "address": "Address_street", "city": "City", "state": "State", "phone": "Phone",
+    })
+    first = df["first_name"].str.title().fillna("")
+    last = df["last_name"].str.title().fillna("")
+    df["Bname"] = (first + " " + last).str.strip()
+    addr_part = [df["Address_street"].fillna(""), df["City"].fillna(""), df["State"].fillna("")]
+    df["Address"] = pd.DataFrame(addr_part).T.apply(lambda x: ", ".join(filter(None, x)), axis=1)
+    return df[["Card_id", "Ssn", "Bname", "Address", "Phone"]]
+
+
+def bench_borrowers(rows: int, seed: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "borrowers.csv"
+        elapsed, _ = _timed(write_synthetic_borrowers, source, rows, seed)
+        print(f"Wrote {rows:,} raw borrower rows in {elapsed:.1f}s")
+        raw = pd.read_csv(source, dtype=str)
+
+    legacy_time, legacy = _timed(legacy_prepare_borrowers, raw.copy())
+    current_time, current = _timed(normalize.prepare_borrowers, raw.copy())
+    same = legacy.to_csv(index=False) == current.to_csv(index=False)
+
+    print(f"row-wise prepare_borrowers:   {legacy_time:8.3f}s ({rows / legacy_time:12,.0f} rows/s)")
+    print(f"vectorized prepare_borrowers: {current_time:8.3f}s ({rows / current_time:12,.0f} rows/s)")
+    print(f"speedup: {legacy_time / current_time:.1f}x")
+    print(f"results identical: {'yes' if same else 'NO'}")
+    if not same:
+        raise SystemExit(1)
+
+
+# Dataset sizes for the regression suite: synthetic.generate() arguments.
+SUITE_SIZES = {
+    "small": {"books": 10_000, "borrowers": 2_000, "loans": 30_000},
+    "medium": {"books": 100_000, "borrowers": 10_000, "loans": 300_000},
+    "large": {"books": 1_000_000, "borrowers": 100_000, "loans": 3_000_000},
+}
+BASELINE_FILE = Path("benchmark_baseline.json")
+# A case regresses when its median is this much slower than the baseline ...
+REGRESSION_THRESHOLD = 0.25
+# ... and by at least this many milliseconds, so timer noise on fast cases is ignored.
+REGRESSION_MIN_DELTA_MS = 5.0
+SUITE_QUERIES = 20
+SUITE_CHECKOUTS = 60
+
+
+def _quietly(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def _export_normalized_csvs(conn, directory: Path) -> None:
+    """Write the tables load_all() reads back in the normalized CSV layout."""
+    for path, sql in (
+        (load_data.BOOK_FILE, "SELECT Isbn, Title FROM BOOK"),
+        (load_data.AUTHORS_FILE, "SELECT Author_id, Name FROM AUTHORS"),
+        (load_data.BOOK_AUTHORS_FILE, "SELECT Author_id, Isbn FROM BOOK_AUTHORS"),
+        (load_data.BORROWER_FILE, "SELECT Card_id, Ssn, Bname, Address, Phone FROM BORROWER"),
+    ):
+        cursor = conn.execute(sql)
+        with (directory / path.name).open("w", encoding="utf-8", newline="") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(column[0] for column in cursor.description)
+            writer.writerows(cursor)
+
+
+class SuiteFixture:
+    """A synthetic database of one size plus the inputs each case needs."""
+
+    def __init__(self, directory: Path, size: str, seed: int = 42):
+        self.directory = directory
+        self.size = size
+        self.db_path = directory / f"{size}.db"
+        counts = SUITE_SIZES[size]
+        conn = get_connection(self.db_path, instrumented=False)
+        _quietly(synthetic.generate, conn, counts["books"], counts["borrowers"], counts["loans"], seed=seed)
+
+        rng = random.Random(seed)
+        titles = [row[0] for row in conn.execute(
+            "SELECT Title FROM BOOK ORDER BY random() LIMIT ?", (SUITE_QUERIES,))]
+        self.queries = [" ".join(title.split()[:rng.randint(1, 2)]) for title in titles]
+        self.queries.append(conn.execute("SELECT Isbn FROM BOOK LIMIT 1").fetchone()[0])
+        self.cards = [row[0] for row in conn.execute(
+            "SELECT Card_id FROM BOOK_LOANS WHERE Date_in IS NULL GROUP BY Card_id LIMIT ?", (SUITE_QUERIES,))]
+        # Borrowers free to borrow, and books on the shelf, for checkout/check-in cycles.
+        self.borrowers = [row[0] for row in conn.execute(
+            """
+            SELECT Card_id FROM BORROWER bor
+            WHERE NOT EXISTS (SELECT 1 FROM BOOK_LOANS bl WHERE bl.Card_id = bor.Card_id AND bl.Date_in IS NULL)
+              AND NOT EXISTS (
+                  SELECT 1 FROM FINES f JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+                  WHERE bl.Card_id = bor.Card_id AND f.Paid = 0)
+            LIMIT ?
+            """, (SUITE_CHECKOUTS,))]
+        self.available = [row[0] for row in conn.execute(
+            """
+            SELECT Isbn FROM BOOK b
+            WHERE NOT EXISTS (SELECT 1 FROM BOOK_LOANS bl WHERE bl.Isbn = b.Isbn AND bl.Date_in IS NULL)
+            ORDER BY random() LIMIT ?
+            """, (len(self.borrowers),))]
+
+        self.csv_dir = directory / f"{size}_csv"
+        self.csv_dir.mkdir()
+        _export_normalized_csvs(conn, self.csv_dir)
+        conn.close()
+        self.raw_books = directory / f"{size}_books.csv"
+        write_synthetic_books(self.raw_books, counts["books"], seed)
+
+    def connect(self):
+        return get_connection(self.db_path, instrumented=False)
+
+
+def _median_time(repeat: int, run, setup=None) -> float:
+    """Median seconds of ``run(state)`` over ``repeat`` runs; ``setup()`` is untimed."""
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run_suite_size(fixture: SuiteFixture, repeat: int) -> dict:
+    """Time every hot function against one fixture; returns {case: median seconds}."""
+    results = {}
+    conn = fixture.connect()
+
+    results["search.search_books"] = _median_time(
+        repeat, lambda _: [search.search_books(conn, q) for q in fixture.queries])
+    results["search.search_page"] = _median_time(
+        repeat, lambda _: [search.search_page(conn, q) for q in fixture.queries + [""]])
+    results["loans.find_open_loans"] = _median_time(
+        repeat, lambda _: [loans.find_open_loans(conn, card_id=card) for card in fixture.cards])
+
+    # Each round checks books out to idle borrowers, then checks them back in,
+    # leaving the borrowers free for the next round.
+    pairs = list(zip(fixture.available, fixture.borrowers))
+    checkout_times, checkin_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        loan_ids = [loans.checkout(conn, isbn, card) for isbn, card in pairs]
+        checkout_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for i in range(0, len(loan_ids), loans.MAX_ACTIVE_LOANS):
+            loans.checkin_multiple(conn, loan_ids[i:i + loans.MAX_ACTIVE_LOANS])
+        checkin_times.append(time.perf_counter() - start)
+    results["loans.checkout"] = statistics.median(checkout_times)
+    results["loans.checkin_multiple"] = statistics.median(checkin_times)
+
+    results["fines.refresh_fines"] = _median_time(repeat, lambda _: fines.refresh_fines(conn))
+    results["fines.list_outstanding_fines"] = _median_time(repeat, lambda _: fines.list_outstanding_fines(conn))
+    conn.close()
+
+    def fresh_database(_count=[0]):
+        _count[0] += 1
+        return get_connection(fixture.directory / f"{fixture.size}_load_{_count[0]}.db", instrumented=False)
+
+    def load(target):
+        _quietly(load_data.load_all, target, source_dir=fixture.csv_dir)
+        target.close()
+
+    results["load_data.load_all"] = _median_time(repeat, load, fresh_database)
+
+    output = fixture.directory / f"{fixture.size}_out"
+    results["normalize.normalize_Books"] = _median_time(repeat, lambda _: _quietly(
+        normalize.normalize_Books, str(fixture.raw_books), f"{output}_book.csv",
+        authorsFile=f"{output}_authors.csv", bookAuthorsFile=f"{output}_book_authors.csv",
+    ))
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float,
+                        min_delta_ms: float = REGRESSION_MIN_DELTA_MS) -> list:
+    """Print current versus baseline timings; returns the regressed case names."""
+    regressions = []
+    print(f"{'case':<44} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for case, seconds in results.items():
+        before = baseline.get(case)
+        if before is None:
+            print(f"{case:<44} {'-':>12} {seconds * 1000:>12.1f} {'new':>8}")
+            continue
+        change = seconds / before - 1 if before else 0.0
+        regressed = change > threshold and (seconds - before) * 1000 >= min_delta_ms
+        if regressed:
+            regressions.append(case)
+        print(f"{case:<44} {before * 1000:>12.1f} {seconds * 1000:>12.1f} {change:>+8.0%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def bench_suite(sizes, repeat: int, baseline_path: Path, save: bool, threshold: float, seed: int) -> None:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            start = time.perf_counter()
+            fixture = SuiteFixture(Path(tmp), size, seed)
+            print(f"Built {size} fixture ({SUITE_SIZES[size]['books']:,} books, "
+                  f"{SUITE_SIZES[size]['loans']:,} loans) in {time.perf_counter() - start:.1f}s")
+            for case, seconds in run_suite_size(fixture, repeat).items():
+                results[f"{case}[{size}]"] = seconds
+
+    if save:
+        recorded = {}
+        if baseline_path.exists():
+            recorded = json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+        recorded.update(results)
+        baseline_path.write_text(json.dumps({
+            "recorded": date.today().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "results": recorded,
+        }, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        for case, seconds in results.items():
+            print(f"{case:<44} {seconds * 1000:>12.1f} ms")
+        print(f"Baseline saved to {baseline_path}.")
+        return
+
+    if not baseline_path.exists():
+        for case, seconds in results.items():
+            print(f"{case:<44} {seconds * 1000:>12.1f} ms")
+        print(f"No baseline at {baseline_path}; run with --save to record one.")
+        return
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    regressions = compare_to_baseline(results, baseline["results"], threshold)
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by more than {threshold:.0%}: {', '.join(regressions)}")
+        raise SystemExit(1)
+    print(f"No regressions beyond {threshold:.0%} against the baseline from {baseline['recorded']}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    fines_parser = sub.add_parser("fines", help="refresh_fines against a synthetic loan history")
+    fines_parser.add_argument("--loans", type=int, default=1_000_000)
+    fines_parser.add_argument("--seed", type=int, default=42)
+
+    normalize_parser = sub.add_parser("normalize", help="normalize_Books serial versus --workers")
+    normalize_parser.add_argument("--rows", type=int, default=1_000_000)
+    normalize_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                                  help="largest worker count to try (powers of two up to this)")
+    normalize_parser.add_argument("--seed", type=int, default=42)
+
+    borrowers_parser = sub.add_parser("borrowers", help="normalize.prepare_borrowers on a synthetic borrower file")
+    borrowers_parser.add_argument("--rows", type=int, default=1_000_000)
+    borrowers_parser.add_argument("--seed", type=int, default=42)
+
+    suite_parser = sub.add_parser("suite", help="every hot function at several sizes, checked against a baseline")
+    suite_parser.add_argument("--sizes", nargs="+", choices=list(SUITE_SIZES), default=["small", "medium"])
+    suite_parser.add_argument("--repeat", type=int, default=5, help="runs per case; the median is kept")
+    suite_parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    suite_parser.add_argument("--save", action="store_true", help="record these timings as the baseline")
+    suite_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                              help=f"allowed slowdown before failing (default {REGRESSION_THRESHOLD})")
+    suite_parser.add_argument("--seed", type=int, default=42)
+
+    args = parser.parse_args()
+    if args.benchmark == "fines":
+        bench_fines(args.loans, args.seed)
+    elif args.benchmark == "normalize":
+        bench_normalize(args.rows, args.workers, args.seed)
+    elif args.benchmark == "borrowers":
+        bench_borrowers(args.rows, args.seed)
+    elif args.benchmark == "suite":
+        bench_suite(args.sizes, args.repeat, args.baseline, args.save, args.threshold, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from typing import Optional
+import json
+from typing import List, Optional
 
 from db import db_transaction
 
@@ -33,3 +34,51 @@ def create_borrower(
             (card_id, ssn, name, address, phone),
         )
         return card_id
+
+
+def get_borrowers(conn, card_ids: List[int]) -> List[dict]:
+    """Look up several borrowers, with their open loans and unpaid fines, in one query.
+
+    Returns one ``{"card_id", "name", "ssn", "address", "phone",
+    "active_loans", "unpaid_fines", "error"}`` dict per requested id, in order.
+    """
+    card_ids = [int(card_id) for card_id in card_ids]
+    found = {
+        row["Card_id"]: row
+        for row in conn.execute(
+            """
+            SELECT
+                bor.Card_id,
+                bor.Bname,
+                bor.Ssn,
+                bor.Address,
+                bor.Phone,
+                (SELECT COUNT(*) FROM BOOK_LOANS bl
+                 WHERE bl.Card_id = bor.Card_id AND bl.Date_in IS NULL) AS Active_loans,
+                (SELECT COALESCE(SUM(f.Fine_amt), 0) FROM FINES f
+                 JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+                 WHERE bl.Card_id = bor.Card_id AND f.Paid = 0) AS Unpaid_fines
+            FROM BORROWER bor
+            WHERE bor.Card_id IN (SELECT value FROM json_each(?))
+            """,
+            (json.dumps(sorted(set(card_ids))),),
+        )
+    }
+    results = []
+    for card_id in card_ids:
+        row = found.get(card_id)
+        if row is None:
+            results.append({"card_id": card_id, "name": None, "ssn": None, "address": None, "phone": None,
+                            "active_loans": None, "unpaid_fines": None, "error": "Borrower not found"})
+            continue
+        results.append({
+            "card_id": card_id,
+            "name": row["Bname"],
+            "ssn": row["Ssn"],
+            "address": row["Address"],
+            "phone": row["Phone"],
+            "active_loans": row["Active_loans"],
+            "unpaid_fines": row["Unpaid_fines"],
+            "error": None,
+        })
+    return results
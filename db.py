@@ -1,16 +1,106 @@
+import os
+import queue
 import sqlite3
+import threading
 from contextlib import contextmanager
 from pathlib import Path
 
-DB_PATH = Path("library.db")
+from flask import current_app, g
 
+import querystats
+from querystats import InstrumentedConnection
 
-def get_connection(db_path: Path = DB_PATH) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+DB_PATH = Path(os.environ.get("LIBRARY_DB_PATH", "library.db"))
+
+DEFAULT_POOL_SIZE = int(os.environ.get("LIBRARY_DB_POOL_SIZE", "8"))
+DEFAULT_POOL_TIMEOUT = float(os.environ.get("LIBRARY_DB_POOL_TIMEOUT", "5"))
+
+# Named PRAGMA sets applied to every new connection.  "default" leaves SQLite's
+# built-in behaviour alone; "production" lets readers run alongside a writer
+# (WAL) and waits on locks instead of failing with "database is locked".
+PROFILES = {
+    "default": {},
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,  # negative values are KiB, i.e. 64 MiB
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+DEFAULT_PROFILE = os.environ.get("LIBRARY_DB_PROFILE", "production")
+
+# Time every statement (see querystats.py); set LIBRARY_DB_INSTRUMENT=0 to
+# use plain sqlite3 connections.
+INSTRUMENT_QUERIES = os.environ.get("LIBRARY_DB_INSTRUMENT", "1") != "0"
+
+# PRAGMAs that read back as integers even when set by keyword.
+_PRAGMA_KEYWORDS = {
+    "synchronous": {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3},
+    "temp_store": {"DEFAULT": 0, "FILE": 1, "MEMORY": 2},
+}
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no pooled connection frees up within the acquire timeout."""
+
+
+def get_connection(db_path: Path = DB_PATH, check_same_thread: bool = True,
+                   profile: str = None, instrumented: bool = None) -> sqlite3.Connection:
+    if instrumented is None:
+        instrumented = INSTRUMENT_QUERIES
+    factory = InstrumentedConnection if instrumented else sqlite3.Connection
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread, factory=factory)
     conn.row_factory = sqlite3.Row
+    apply_profile(conn, profile)
     return conn
 
 
+def _profile_settings(profile: str = None) -> dict:
+    name = profile or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown database profile '{name}' (expected one of {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def apply_profile(conn: sqlite3.Connection, profile: str = None) -> None:
+    for pragma, value in _profile_settings(profile).items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+def check_profile(conn: sqlite3.Connection, profile: str = None) -> dict:
+    """Compare a profile's PRAGMAs with what the connection actually reports.
+
+    Returns ``{pragma: (requested, effective, applied)}``.  Settings can be
+    silently refused, e.g. WAL on an in-memory database or an ``mmap_size``
+    above the library's compile-time limit.
+    """
+    report = {}
+    for pragma, requested in _profile_settings(profile).items():
+        row = conn.execute(f"PRAGMA {pragma}").fetchone()
+        effective = row[0] if row else None
+        expected = _PRAGMA_KEYWORDS.get(pragma, {}).get(str(requested).upper(), requested)
+        if isinstance(expected, str):
+            applied = str(effective).lower() == expected.lower()
+        else:
+            applied = effective == expected
+        report[pragma] = (requested, effective, applied)
+    return report
+
+
+def print_profile_check(conn: sqlite3.Connection, profile: str = None) -> None:
+    name = profile or DEFAULT_PROFILE
+    report = check_profile(conn, profile)
+    if not report:
+        print(f"Database profile '{name}': SQLite defaults")
+        return
+    print(f"Database profile '{name}':")
+    for pragma, (requested, effective, applied) in report.items():
+        status = "ok" if applied else f"NOT APPLIED (requested {requested})"
+        print(f"  {pragma} = {effective} [{status}]")
+
+
 @contextmanager
 def db_transaction(conn: sqlite3.Connection):
     try:
@@ -19,3 +109,128 @@ def db_transaction(conn: sqlite3.Connection):
     except Exception:
         conn.rollback()
         raise
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared across request threads.
+
+    Connections are opened lazily up to ``size``; once all are checked out,
+    ``acquire`` waits up to ``timeout`` seconds for one to be released.  A
+    connection is only ever used by one thread at a time, so it is opened
+    with ``check_same_thread=False`` to allow hand-off between threads.
+    """
+
+    def __init__(self, db_path: Path = DB_PATH, size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_POOL_TIMEOUT, profile: str = None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.profile = profile
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    @property
+    def opened(self) -> int:
+        return self._opened
+
+    @property
+    def idle(self) -> int:
+        return self._idle.qsize()
+
+    def _open(self) -> sqlite3.Connection:
+        return get_connection(self.db_path, check_same_thread=False, profile=self.profile)
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    conn = self._open()
+            if conn is None:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout(
+                        f"No database connection available after {self.timeout}s "
+                        f"(pool size {self.size})"
+                    ) from None
+
+        if not self._is_healthy(conn):
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            conn = self._open()
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connections are replaced by the health check on next acquire.
+            pass
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._opened -= 1
+
+
+def init_app(app) -> ConnectionPool:
+    """Attach a connection pool to ``app`` and release connections on teardown."""
+    app.config.setdefault("DB_PATH", DB_PATH)
+    app.config.setdefault("DB_POOL_SIZE", DEFAULT_POOL_SIZE)
+    app.config.setdefault("DB_POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT)
+    app.config.setdefault("DB_PROFILE", DEFAULT_PROFILE)
+    app.config.setdefault("SLOW_QUERY_MS", querystats.STATS.slow_ms)
+    querystats.STATS.slow_ms = app.config["SLOW_QUERY_MS"]
+    pool = ConnectionPool(
+        app.config["DB_PATH"],
+        size=app.config["DB_POOL_SIZE"],
+        timeout=app.config["DB_POOL_TIMEOUT"],
+        profile=app.config["DB_PROFILE"],
+    )
+    app.extensions["db_pool"] = pool
+    app.teardown_appcontext(close_db)
+    return pool
+
+
+def get_db() -> sqlite3.Connection:
+    """Return the connection for the current request, acquiring it on first use."""
+    if "db" not in g:
+        g.db = current_app.extensions["db_pool"].acquire()
+    return g.db
+
+
+def close_db(exc=None) -> None:
+    conn = g.pop("db", None)
+    if conn is not None:
+        current_app.extensions["db_pool"].release(conn)
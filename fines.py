@@ -1,3 +1,4 @@
+import json
 from datetime import date
 from typing import List, Optional
 
@@ -5,59 +6,105 @@ from db import db_transaction
 
 DAILY_FINE = 0.25
 
+# APP_STATE key recording the last day fines were fully computed through.
+WATERMARK_KEY = "fines_computed_through"
 
-def _parse_iso(value: str) -> date:
-    return date.fromisoformat(value)
 
+# Days late and amount are computed in SQL and upserted in one statement.
+# julianday() differences of ISO dates are whole days, and multiples of
+# DAILY_FINE are exact in floating point, so the result matches
+# round(days_late * DAILY_FINE, 2) computed in Python.  Paid fines are
+# never rewritten.
+REFRESH_FINES_SQL = """
+INSERT INTO FINES (Loan_id, Fine_amt, Paid)
+SELECT
+    Loan_id,
+    ROUND(
+        CAST(julianday(COALESCE(Date_in, :today)) - julianday(Due_date) AS INTEGER)
+        * :daily_fine,
+        2
+    ),
+    0
+FROM BOOK_LOANS
+WHERE Due_date < :today
+  AND (Date_in IS NULL OR Date_in > Due_date)
+  {extra_clause}
+ON CONFLICT(Loan_id) DO UPDATE SET Fine_amt = excluded.Fine_amt
+WHERE FINES.Paid = 0
+"""
 
-def refresh_fines(conn, today: Optional[date] = None, loan_id: Optional[int] = None) -> None:
+
+# Incremental refreshes only revisit loans whose fine can have changed since
+# the watermark: those still open, and those closed on or after it.  Loans
+# returned before the watermark already had their final fine computed.
+INCREMENTAL_CLAUSE = """
+  AND Loan_id IN (
+      SELECT Loan_id FROM BOOK_LOANS WHERE Date_in IS NULL
+      UNION ALL
+      SELECT Loan_id FROM BOOK_LOANS WHERE Date_in >= :since
+  )
+"""
+
+
+def _ensure_state_table(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS APP_STATE (
+            Name  VARCHAR(50) PRIMARY KEY,
+            Value VARCHAR(255) NOT NULL
+        )
+        """
+    )
+
+
+def get_watermark(conn) -> Optional[date]:
+    """Return the date fines were last fully computed through, if any."""
+    _ensure_state_table(conn)
+    row = conn.execute("SELECT Value FROM APP_STATE WHERE Name = ?", (WATERMARK_KEY,)).fetchone()
+    return date.fromisoformat(row[0]) if row else None
+
+
+def refresh_fines(
+    conn,
+    today: Optional[date] = None,
+    loan_id: Optional[int] = None,
+    incremental: bool = False,
+    loan_ids: Optional[List[int]] = None,
+) -> int:
+    """Recalculate unpaid fines for overdue loans; returns the number of fines written.
+
+    With ``incremental=True`` only loans open on, or closed since, the stored
+    watermark are recalculated; without a usable watermark the refresh falls
+    back to a full pass.  ``loan_id`` or ``loan_ids`` limit the refresh to
+    those loans; any other refresh moves the watermark to ``today``.
+    """
     today = today or date.today()
-    params = {"today": today.isoformat()}
+    params = {"today": today.isoformat(), "daily_fine": DAILY_FINE}
     extra_clause = ""
     if loan_id is not None:
-        extra_clause = " AND Loan_id = :loan_id"
+        extra_clause = "AND Loan_id = :loan_id"
         params["loan_id"] = int(loan_id)
-
-    cursor = conn.cursor()
-    rows = cursor.execute(
-        """
-        SELECT Loan_id, Due_date, Date_in
-        FROM BOOK_LOANS
-        WHERE Due_date < :today
-          AND (Date_in IS NULL OR Date_in > Due_date)
-        """
-        + extra_clause,
-        params,
-    ).fetchall()
+    elif loan_ids is not None:
+        extra_clause = "AND Loan_id IN (SELECT value FROM json_each(:loan_ids))"
+        params["loan_ids"] = json.dumps([int(x) for x in loan_ids])
+    elif incremental:
+        since = get_watermark(conn)
+        if since is not None and since <= today:
+            extra_clause = INCREMENTAL_CLAUSE
+            params["since"] = since.isoformat()
 
     with db_transaction(conn):
-        for row in rows:
-            due_date = _parse_iso(row["Due_date"])
-            if row["Date_in"]:
-                end_date = _parse_iso(row["Date_in"])
-            else:
-                end_date = today
-            days_late = (end_date - due_date).days
-            if days_late <= 0:
-                continue
-            fine_amt = round(days_late * DAILY_FINE, 2)
-
-            existing = conn.execute(
-                "SELECT Paid FROM FINES WHERE Loan_id = ?",
-                (row["Loan_id"],),
-            ).fetchone()
-            if existing:
-                if existing["Paid"]:
-                    continue
-                conn.execute(
-                    "UPDATE FINES SET Fine_amt = ? WHERE Loan_id = ? AND Paid = 0",
-                    (fine_amt, row["Loan_id"]),
-                )
-            else:
-                conn.execute(
-                    "INSERT INTO FINES (Loan_id, Fine_amt, Paid) VALUES (?, ?, 0)",
-                    (row["Loan_id"], fine_amt),
-                )
+        cursor = conn.execute(REFRESH_FINES_SQL.format(extra_clause=extra_clause), params)
+        if loan_id is None and loan_ids is None:
+            _ensure_state_table(conn)
+            conn.execute(
+                """
+                INSERT INTO APP_STATE (Name, Value) VALUES (?, ?)
+                ON CONFLICT(Name) DO UPDATE SET Value = excluded.Value
+                """,
+                (WATERMARK_KEY, today.isoformat()),
+            )
+    return cursor.rowcount
 
 
 def list_outstanding_fines(conn) -> List[dict]:
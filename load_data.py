@@ -1,9 +1,19 @@
+import argparse
 import csv
 import re
+import sys
+import time
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Iterable, Tuple
+from typing import Iterable, Iterator, List
 
-from db import get_connection
+from db import db_transaction, get_connection
+from loans import check_availability, ensure_availability, rebuild_availability
+from search import (
+    BOOK_AUTHORS_EXPR, SEARCH_FROM, SEARCH_INDEXES, SEARCH_TABLES, ensure_search_index, rebuild_search_index,
+)
+from suggest import ensure_change_feed, rebuild_change_feed
 
 SCHEMA_FILE = Path("schema.sql")
 BOOK_FILE = Path("book.csv")
@@ -11,7 +21,26 @@ AUTHORS_FILE = Path("authors.csv")
 BOOK_AUTHORS_FILE = Path("book_authors.csv")
 BORROWER_FILE = Path("borrower.csv")
 
+# Rows per executemany() call; CSVs are streamed, so memory stays flat
+# regardless of file size.
+BATCH_SIZE = 50000
+
+# Applied for the duration of a full reload.  The database is rebuilt from
+# scratch on failure anyway, so durability is traded for load speed.
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": -131072,  # 128 MiB; bounds the loader's memory
+    # The production profile keeps temp tables in RAM; index-build sorts
+    # over millions of rows spill to disk instead.
+    "temp_store": "FILE",
+}
+
 DROP_STATEMENTS = """
+DROP TABLE IF EXISTS APP_STATE;
+DROP TABLE IF EXISTS CATALOG_CHANGES;
+DROP TABLE IF EXISTS BOOK_FTS;
+DROP TABLE IF EXISTS BOOK_SEARCH;
 DROP TABLE IF EXISTS USERS;
 DROP TABLE IF EXISTS FINES;
 DROP TABLE IF EXISTS BOOK_LOANS;
@@ -22,6 +51,123 @@ DROP TABLE IF EXISTS BOOK;
 """
 
 
+# Secondary indexes for the circulation, fine and search hot paths.  Partial
+# indexes on open loans stay small however long the loan history grows.
+INDEXES = {
+    # "Is this ISBN out, and to whom?" (search status and Borrower_ID columns)
+    "IDX_BOOK_LOANS_OPEN_ISBN": "BOOK_LOANS(Isbn, Card_id) WHERE Date_in IS NULL",
+    # Active-loan count per borrower (checkout limit, delete-borrower guard)
+    "IDX_BOOK_LOANS_OPEN_CARD": "BOOK_LOANS(Card_id) WHERE Date_in IS NULL",
+    # All loans per borrower, for unpaid-fine joins on profile and checkout
+    "IDX_BOOK_LOANS_CARD": "BOOK_LOANS(Card_id)",
+    # Loans returned since the fine watermark (incremental fine refresh)
+    "IDX_BOOK_LOANS_RETURNED": "BOOK_LOANS(Date_in) WHERE Date_in IS NOT NULL",
+    # Outstanding fines listing
+    "IDX_FINES_UNPAID": "FINES(Loan_id) WHERE Paid = 0",
+    # Authors per book (the primary key leads with Author_id)
+    "IDX_BOOK_AUTHORS_ISBN": "BOOK_AUTHORS(Isbn, Author_id)",
+    # Books currently out, and to whom (search status filter)
+    "IDX_BOOK_CHECKED_OUT": "BOOK(Current_card_id) WHERE Current_loan_id IS NOT NULL",
+    # Availability by ISBN without touching BOOK's rows (search result join)
+    "IDX_BOOK_AVAILABILITY": "BOOK(Isbn, Current_loan_id, Current_card_id)",
+}
+
+# (description, query, index the planner is expected to use)
+INDEX_CHECKS = [
+    (
+        "checkout: is ISBN checked out",
+        "SELECT 1 FROM BOOK_LOANS bl WHERE bl.Isbn = ? AND bl.Date_in IS NULL",
+        "IDX_BOOK_LOANS_OPEN_ISBN",
+    ),
+    (
+        "availability triggers: current loan of ISBN",
+        """
+        SELECT bl.Card_id FROM BOOK_LOANS bl
+        WHERE bl.Isbn = ? AND bl.Date_in IS NULL
+        ORDER BY bl.Loan_id DESC LIMIT 1
+        """,
+        "IDX_BOOK_LOANS_OPEN_ISBN",
+    ),
+    (
+        "checkout: active loans for borrower",
+        "SELECT COUNT(*) FROM BOOK_LOANS WHERE Card_id = ? AND Date_in IS NULL",
+        "IDX_BOOK_LOANS_OPEN_CARD",
+    ),
+    (
+        "checkout/profile: unpaid fines for borrower",
+        """
+        SELECT COUNT(*) FROM FINES f
+        JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+        WHERE bl.Card_id = ? AND f.Paid = 0
+        """,
+        "IDX_BOOK_LOANS_CARD",
+    ),
+    (
+        "fines: outstanding fines",
+        """
+        SELECT bor.Card_id, SUM(f.Fine_amt) FROM FINES f
+        JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+        JOIN BORROWER bor ON bl.Card_id = bor.Card_id
+        WHERE f.Paid = 0
+        GROUP BY bor.Card_id
+        """,
+        "IDX_FINES_UNPAID",
+    ),
+    (
+        "fines: loans returned since watermark",
+        "SELECT Loan_id FROM BOOK_LOANS WHERE Date_in >= ?",
+        "IDX_BOOK_LOANS_RETURNED",
+    ),
+    (
+        "search: books checked out",
+        "SELECT Isbn, Current_card_id FROM BOOK WHERE Current_loan_id IS NOT NULL",
+        "IDX_BOOK_CHECKED_OUT",
+    ),
+    (
+        "search: browse in title order",
+        f"SELECT s.Isbn, s.Title FROM {SEARCH_FROM} ORDER BY s.Title, s.Isbn LIMIT 51",
+        "IDX_BOOK_SEARCH_TITLE",
+    ),
+    (
+        "search: availability of result rows",
+        f"SELECT s.Isbn, b.Current_loan_id, b.Current_card_id FROM {SEARCH_FROM} "
+        "ORDER BY s.Title, s.Isbn LIMIT 51",
+        "IDX_BOOK_AVAILABILITY",
+    ),
+    (
+        "search: authors of a book",
+        "SELECT " + BOOK_AUTHORS_EXPR.format(isbn="?"),
+        "IDX_BOOK_AUTHORS_ISBN",
+    ),
+]
+
+
+# Production-shaped planner statistics (sqlite_stat1 rows) for the index
+# check: a long loan history with few open loans and mostly paid fines.
+# Query plans depend on these, so checking against a fixed shape keeps the
+# result independent of whatever happens to be in library.db.
+PLANNER_STATS = [
+    ("BOOK", "sqlite_autoindex_BOOK_1", "1000000 1"),
+    ("BOOK", "IDX_BOOK_CHECKED_OUT", "50000 2"),
+    ("BOOK", "IDX_BOOK_AVAILABILITY", "1000000 1 1 1"),
+    ("BOOK_SEARCH", None, "1000000"),
+    ("BOOK_SEARCH", "sqlite_autoindex_BOOK_SEARCH_1", "1000000 1"),
+    ("BOOK_SEARCH", "IDX_BOOK_SEARCH_TITLE", "1000000 2 1"),
+    ("AUTHORS", None, "400000"),
+    ("BOOK_AUTHORS", "sqlite_autoindex_BOOK_AUTHORS_1", "1300000 3 1"),
+    ("BOOK_AUTHORS", "IDX_BOOK_AUTHORS_ISBN", "1300000 2 1"),
+    ("BORROWER", None, "100000"),
+    ("BORROWER", "sqlite_autoindex_BORROWER_1", "100000 1"),
+    ("BOOK_LOANS", None, "5000000"),
+    ("BOOK_LOANS", "IDX_BOOK_LOANS_OPEN_ISBN", "50000 1 1"),
+    ("BOOK_LOANS", "IDX_BOOK_LOANS_OPEN_CARD", "50000 2"),
+    ("BOOK_LOANS", "IDX_BOOK_LOANS_CARD", "5000000 50"),
+    ("BOOK_LOANS", "IDX_BOOK_LOANS_RETURNED", "4950000 3"),
+    ("FINES", None, "600000"),
+    ("FINES", "IDX_FINES_UNPAID", "20000 1"),
+]
+
+
 def _read_csv_rows(path: Path) -> Iterable[dict]:
     if not path.exists():
         raise FileNotFoundError(f"Missing required CSV: {path}")
@@ -30,51 +176,185 @@ def _read_csv_rows(path: Path) -> Iterable[dict]:
         yield from reader
 
 
-def initialize_schema(conn) -> None:
+def _batched(rows: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_batches(conn, sql: str, rows: Iterable, batch_size: int = BATCH_SIZE) -> int:
+    total = 0
+    for batch in _batched(rows, batch_size):
+        conn.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+@contextmanager
+def bulk_load_pragmas(conn):
+    """Switch to BULK_LOAD_PRAGMAS, restoring the previous settings afterwards."""
+    saved = {
+        pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        for pragma in BULK_LOAD_PRAGMAS
+    }
+    for pragma, value in BULK_LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    try:
+        yield
+    finally:
+        if conn.in_transaction:
+            conn.commit()
+        for pragma, value in saved.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+def initialize_schema(conn, with_indexes: bool = True) -> None:
     conn.executescript(DROP_STATEMENTS)
     conn.executescript(SCHEMA_FILE.read_text(encoding="utf-8"))
+    if with_indexes:
+        create_indexes(conn)
+
+
+def create_indexes(conn) -> List[str]:
+    """Create any missing INDEXES; returns the names of those created."""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    for name, definition in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+    return [name for name in INDEXES if name not in existing]
 
 
-def load_book(conn) -> None:
-    rows: Tuple[Tuple[str, str], ...] = tuple(
+def _has_statistics(conn) -> bool:
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    ).fetchone()
+    return bool(exists and conn.execute("SELECT 1 FROM sqlite_stat1 LIMIT 1").fetchone())
+
+
+def migrate(conn) -> None:
+    """Bring an existing database up to the current schema without reloading data."""
+    conn.executescript(SCHEMA_FILE.read_text(encoding="utf-8"))
+    ensure_availability(conn)
+    created = create_indexes(conn)
+    # A full ANALYZE rescans every index, so only pay for it when there is
+    # something new to measure; otherwise let SQLite refresh stale stats.
+    if created or not _has_statistics(conn):
+        conn.execute("ANALYZE")
+    else:
+        conn.execute("PRAGMA optimize")
+    conn.commit()
+    ensure_search_index(conn)
+    ensure_change_feed(conn)
+
+
+# Delta import: (table, key columns, content columns, rows kept even when
+# absent from the feed).  Tables are upserted in this order and pruned in
+# reverse, so link rows go before the books and authors they reference.
+DELTA_TABLES = (
+    ("AUTHORS", ("Author_id",), ("Name",),
+     "EXISTS (SELECT 1 FROM BOOK_AUTHORS ba WHERE ba.Author_id = t.Author_id)"),
+    ("BOOK", ("Isbn",), ("Title",),
+     "EXISTS (SELECT 1 FROM BOOK_LOANS bl WHERE bl.Isbn = t.Isbn)"),
+    # Links of a book kept for its loans stay with it (and keep its authors).
+    ("BOOK_AUTHORS", ("Author_id", "Isbn"), (),
+     "EXISTS (SELECT 1 FROM BOOK_LOANS bl WHERE bl.Isbn = t.Isbn)"
+     " AND NOT EXISTS (SELECT 1 FROM temp.STAGE_BOOK sb WHERE sb.Isbn = t.Isbn)"),
+    ("BORROWER", ("Card_id",), ("Ssn", "Bname", "Address", "Phone"),
+     "EXISTS (SELECT 1 FROM BOOK_LOANS bl WHERE bl.Card_id = t.Card_id)"
+     " OR EXISTS (SELECT 1 FROM USERS u WHERE u.Card_id = t.Card_id)"),
+)
+
+DROP_STAGING_TABLES = """
+DROP TABLE IF EXISTS temp.STAGE_BOOK;
+DROP TABLE IF EXISTS temp.STAGE_AUTHORS;
+DROP TABLE IF EXISTS temp.STAGE_BOOK_AUTHORS;
+DROP TABLE IF EXISTS temp.STAGE_BORROWER;
+"""
+
+STAGING_TABLES = DROP_STAGING_TABLES + """
+CREATE TEMP TABLE STAGE_BOOK (Isbn CHAR(10) PRIMARY KEY, Title VARCHAR(255) NOT NULL);
+CREATE TEMP TABLE STAGE_AUTHORS (Author_id INTEGER PRIMARY KEY, Name VARCHAR(255) NOT NULL);
+CREATE TEMP TABLE STAGE_BOOK_AUTHORS (
+    Author_id INTEGER NOT NULL,
+    Isbn CHAR(10) NOT NULL,
+    PRIMARY KEY (Author_id, Isbn)
+);
+CREATE TEMP TABLE STAGE_BORROWER (
+    Card_id INTEGER PRIMARY KEY,
+    Ssn CHAR(11) NOT NULL,
+    Bname VARCHAR(255) NOT NULL,
+    Address VARCHAR(255) NOT NULL,
+    Phone VARCHAR(20)
+);
+"""
+
+
+def _planner_fixture():
+    """An empty in-memory copy of the schema carrying PLANNER_STATS."""
+    conn = get_connection(":memory:", profile="default")
+    conn.executescript(SCHEMA_FILE.read_text(encoding="utf-8"))
+    conn.executescript(SEARCH_TABLES + SEARCH_INDEXES)
+    create_indexes(conn)
+    conn.execute("ANALYZE")
+    conn.execute("DELETE FROM sqlite_stat1")
+    conn.executemany("INSERT INTO sqlite_stat1(tbl, idx, stat) VALUES (?, ?, ?)", PLANNER_STATS)
+    conn.execute("ANALYZE sqlite_schema")  # reload the statistics
+    return conn
+
+
+def check_index_usage(conn=None) -> List[str]:
+    """Return a failure message for each hot query that does not use its index.
+
+    Without ``conn`` the plans are taken from a schema-only fixture with
+    production-shaped statistics; pass a connection to check a real database.
+    """
+    conn = conn or _planner_fixture()
+    failures = []
+    for description, sql, index in INDEX_CHECKS:
+        params = [None] * sql.count("?")
+        plan = " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        if index not in plan:
+            failures.append(f"{description}: expected {index}, plan was: {plan}")
+    return failures
+
+
+def _book_rows(records: Iterable[dict]) -> Iterator[tuple]:
+    return (
         (row["Isbn"].strip(), row["Title"].strip())
-        for row in _read_csv_rows(BOOK_FILE)
+        for row in records
         if row.get("Isbn") and row.get("Title")
     )
-    conn.executemany("INSERT INTO BOOK(Isbn, Title) VALUES (?, ?)", rows)
 
 
-def load_authors(conn) -> None:
-    rows = [
+def _author_rows(records: Iterable[dict]) -> Iterator[tuple]:
+    return (
         (int(row["Author_id"]), row["Name"].strip())
-        for row in _read_csv_rows(AUTHORS_FILE)
+        for row in records
         if row.get("Author_id") and row.get("Name")
-    ]
-    conn.executemany("INSERT INTO AUTHORS(Author_id, Name) VALUES (?, ?)", rows)
+    )
 
 
-def load_book_authors(conn) -> None:
-    rows = [
+def _book_author_rows(records: Iterable[dict]) -> Iterator[tuple]:
+    return (
         (int(row["Author_id"]), row["Isbn"].strip())
-        for row in _read_csv_rows(BOOK_AUTHORS_FILE)
+        for row in records
         if row.get("Author_id") and row.get("Isbn")
-    ]
-    conn.executemany(
-        "INSERT INTO BOOK_AUTHORS(Author_id, Isbn) VALUES (?, ?)",
-        rows,
     )
 
 
-def load_borrowers(conn) -> None:
-    def _normalize_card(value: str) -> int:
-        if value is None:
-            raise ValueError("Card_id missing")
-        digits = re.sub(r"\D", "", value)
-        if not digits:
-            raise ValueError(f"Card_id '{value}' has no digits")
-        return int(digits)
+def _normalize_card(value: str) -> int:
+    if value is None:
+        raise ValueError("Card_id missing")
+    digits = re.sub(r"\D", "", value)
+    if not digits:
+        raise ValueError(f"Card_id '{value}' has no digits")
+    return int(digits)
+
 
-    rows = [
+def _borrower_rows(records: Iterable[dict]) -> Iterator[tuple]:
+    return (
         (
             _normalize_card(row["Card_id"]),
             row["Ssn"].strip(),
@@ -82,25 +362,233 @@ def load_borrowers(conn) -> None:
             row["Address"].strip(),
             row.get("Phone", "").strip() or None,
         )
-        for row in _read_csv_rows(BORROWER_FILE)
+        for row in records
         if row.get("Card_id") and row.get("Ssn")
-    ]
-    conn.executemany(
-        "INSERT INTO BORROWER(Card_id, Ssn, Bname, Address, Phone) VALUES (?, ?, ?, ?, ?)",
-        rows,
     )
 
 
-def load_all(conn) -> None:
-    initialize_schema(conn)
-    load_book(conn)
-    load_authors(conn)
-    load_book_authors(conn)
-    load_borrowers(conn)
+BOOK_INSERT = "INSERT INTO BOOK(Isbn, Title) VALUES (?, ?)"
+AUTHORS_INSERT = "INSERT INTO AUTHORS(Author_id, Name) VALUES (?, ?)"
+BOOK_AUTHORS_INSERT = "INSERT INTO BOOK_AUTHORS(Author_id, Isbn) VALUES (?, ?)"
+BORROWER_INSERT = "INSERT INTO BORROWER(Card_id, Ssn, Bname, Address, Phone) VALUES (?, ?, ?, ?, ?)"
+
+
+# Each loader reads its normalized CSV unless given ``rows``: tuples in the
+# column order of its INSERT, already cleaned as the _*_rows() helpers do.
+def load_book(conn, batch_size: int = BATCH_SIZE, rows: Iterable[tuple] = None) -> int:
+    rows = _book_rows(_read_csv_rows(BOOK_FILE)) if rows is None else rows
+    return insert_batches(conn, BOOK_INSERT, rows, batch_size)
+
+
+def load_authors(conn, batch_size: int = BATCH_SIZE, rows: Iterable[tuple] = None) -> int:
+    rows = _author_rows(_read_csv_rows(AUTHORS_FILE)) if rows is None else rows
+    return insert_batches(conn, AUTHORS_INSERT, rows, batch_size)
+
+
+def load_book_authors(conn, batch_size: int = BATCH_SIZE, rows: Iterable[tuple] = None) -> int:
+    rows = _book_author_rows(_read_csv_rows(BOOK_AUTHORS_FILE)) if rows is None else rows
+    return insert_batches(conn, BOOK_AUTHORS_INSERT, rows, batch_size)
+
+
+def load_borrowers(conn, batch_size: int = BATCH_SIZE, rows: Iterable[tuple] = None) -> int:
+    rows = _borrower_rows(_read_csv_rows(BORROWER_FILE)) if rows is None else rows
+    return insert_batches(conn, BORROWER_INSERT, rows, batch_size)
+
+
+def report_load(label: str, rows: int, elapsed: float) -> None:
+    rate = rows / elapsed if elapsed > 0 else float("inf")
+    print(f"  {label:<14} {rows:>10,} rows in {elapsed:7.2f}s ({rate:,.0f} rows/s)")
+
+
+def finish_load(conn) -> None:
+    """Build the secondary and search indexes and the availability columns after a bulk load."""
+    start = time.perf_counter()
+    create_indexes(conn)
+    conn.execute("ANALYZE")
     conn.commit()
+    print(f"  {'indexes':<14} built in {time.perf_counter() - start:.2f}s")
 
+    start = time.perf_counter()
+    rebuild_availability(conn)
+    print(f"  {'availability':<14} built in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    rebuild_search_index(conn)
+    rebuild_change_feed(conn)
+    print(f"  {'search index':<14} built in {time.perf_counter() - start:.2f}s")
+
+
+def load_all(conn, batch_size: int = BATCH_SIZE, source_dir: Path = None) -> None:
+    """Drop and reload every table from the normalized CSVs.
+
+    Loads run under BULK_LOAD_PRAGMAS with secondary indexes and the search
+    index built once at the end rather than maintained row by row.
+    """
+    with bulk_load_pragmas(conn):
+        initialize_schema(conn, with_indexes=False)
+        for label, loader, to_rows, path in (
+            ("BOOK", load_book, _book_rows, BOOK_FILE),
+            ("AUTHORS", load_authors, _author_rows, AUTHORS_FILE),
+            ("BOOK_AUTHORS", load_book_authors, _book_author_rows, BOOK_AUTHORS_FILE),
+            ("BORROWER", load_borrowers, _borrower_rows, BORROWER_FILE),
+        ):
+            if source_dir is not None:
+                path = source_dir / path.name
+            start = time.perf_counter()
+            rows = loader(conn, batch_size, to_rows(_read_csv_rows(path)))
+            report_load(label, rows, time.perf_counter() - start)
+        finish_load(conn)
+
+
+def _stage_feed(conn, batch_size: int) -> None:
+    feeds = {
+        "AUTHORS": (_author_rows, AUTHORS_FILE),
+        "BOOK": (_book_rows, BOOK_FILE),
+        "BOOK_AUTHORS": (_book_author_rows, BOOK_AUTHORS_FILE),
+        "BORROWER": (_borrower_rows, BORROWER_FILE),
+    }
+    conn.executescript(STAGING_TABLES)
+    for table, keys, content, _ in DELTA_TABLES:
+        to_rows, path = feeds[table]
+        columns = keys + content
+        placeholders = ", ".join("?" for _ in columns)
+        insert_batches(
+            conn,
+            f"INSERT OR REPLACE INTO temp.STAGE_{table}({', '.join(columns)}) VALUES ({placeholders})",
+            to_rows(_read_csv_rows(path)),
+            batch_size,
+        )
+
+
+def _apply_upserts(conn, table: str, keys: tuple, content: tuple) -> dict:
+    columns = keys + content
+    same_key = " AND ".join(f"t.{key} = s.{key}" for key in keys)
+    same_row = " AND ".join([same_key] + [f"t.{column} IS s.{column}" for column in content])
+    stage = f"temp.STAGE_{table}"
+
+    inserted = conn.execute(
+        f"SELECT COUNT(*) FROM {stage} s WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {same_key})"
+    ).fetchone()[0]
+    changed = conn.execute(
+        f"SELECT COUNT(*) FROM {stage} s WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {same_row})"
+    ).fetchone()[0]
+
+    if content:
+        conflict = "DO UPDATE SET " + ", ".join(f"{column} = excluded.{column}" for column in content)
+    else:
+        conflict = "DO NOTHING"
+    # Only new or changed rows reach the upsert, so unchanged rows cost one
+    # primary-key probe and fire no triggers.
+    conn.execute(
+        f"""
+        INSERT INTO {table}({', '.join(columns)})
+        SELECT {', '.join('s.' + column for column in columns)}
+        FROM {stage} s
+        WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {same_row})
+        ON CONFLICT({', '.join(keys)}) {conflict}
+        """
+    )
+    return {"inserted": inserted, "updated": changed - inserted}
+
+
+def _apply_deletes(conn, table: str, keys: tuple, protected: str) -> dict:
+    same_key = " AND ".join(f"t.{key} = s.{key}" for key in keys)
+    stale = f"NOT EXISTS (SELECT 1 FROM temp.STAGE_{table} s WHERE {same_key})"
+    retained = 0
+    if protected:
+        retained = conn.execute(
+            f"SELECT COUNT(*) FROM {table} t WHERE {stale} AND ({protected})"
+        ).fetchone()[0]
+        stale += f" AND NOT ({protected})"
+    deleted = conn.execute(f"DELETE FROM {table} AS t WHERE {stale}").rowcount
+    return {"deleted": deleted, "retained": retained}
+
+
+def import_delta(conn, batch_size: int = BATCH_SIZE) -> dict:
+    """Apply the normalized CSVs as a diff against the catalogue tables.
+
+    Rows are matched by primary key and compared column by column; only
+    inserts, updates and deletes are written, in one transaction, so the
+    search index triggers fire for changed rows alone.  BOOK_LOANS, FINES
+    and USERS are never touched, and books or borrowers they still
+    reference are kept (and reported as retained) when dropped from the feed.
+
+    Returns ``{table: {"inserted", "updated", "deleted", "retained"}}``.
+    """
+    _stage_feed(conn, batch_size)
+    summary = {}
+    with db_transaction(conn):
+        for table, keys, content, _ in DELTA_TABLES:
+            summary[table] = _apply_upserts(conn, table, keys, content)
+        for table, keys, _, protected in reversed(DELTA_TABLES):
+            summary[table].update(_apply_deletes(conn, table, keys, protected))
+    conn.executescript(DROP_STAGING_TABLES)
+    return summary
+
+
+def print_delta_summary(summary: dict) -> None:
+    print(f"  {'table':<14} {'inserted':>10} {'updated':>10} {'deleted':>10} {'retained':>10}")
+    for table, counts in summary.items():
+        print(
+            f"  {table:<14} {counts['inserted']:>10,} {counts['updated']:>10,}"
+            f" {counts['deleted']:>10,} {counts['retained']:>10,}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load or upgrade the library database.")
+    parser.add_argument("--migrate", action="store_true",
+                        help="add missing tables and indexes to an existing database instead of reloading")
+    parser.add_argument("--check-indexes", action="store_true",
+                        help="verify with EXPLAIN QUERY PLAN that hot queries use their indexes")
+    parser.add_argument("--live", action="store_true",
+                        help="with --check-indexes, use library.db's own statistics")
+    parser.add_argument("--check-availability", action="store_true",
+                        help="verify BOOK's current-loan columns against BOOK_LOANS")
+    parser.add_argument("--repair", action="store_true",
+                        help="with --check-availability, rebuild the columns if they disagree")
+    parser.add_argument("--delta", action="store_true",
+                        help="apply the CSVs as inserts, updates and deletes, keeping loans, fines and users")
+    args = parser.parse_args()
 
-if __name__ == "__main__":
     with get_connection() as conn:
-        load_all(conn)
-        print("Database refreshed using normalized CSVs.")
+        if args.check_indexes:
+            failures = check_index_usage(conn if args.live else None)
+            for failure in failures:
+                print(failure, file=sys.stderr)
+            print(f"{len(INDEX_CHECKS) - len(failures)}/{len(INDEX_CHECKS)} hot queries use their index.")
+            if failures:
+                sys.exit(1)
+        elif args.check_availability:
+            migrate(conn)
+            mismatches = check_availability(conn)
+            for row in mismatches[:20]:
+                print(
+                    f"{row['Isbn']}: stored loan {row['Current_loan_id']} / card {row['Current_card_id']}, "
+                    f"expected loan {row['Expected_loan_id']} / card {row['Expected_card_id']}",
+                    file=sys.stderr,
+                )
+            if not mismatches:
+                print("Book availability matches the open loans.")
+            elif args.repair:
+                rebuild_availability(conn)
+                print(f"Rebuilt availability; {len(mismatches):,} books were out of step.")
+            else:
+                print(f"{len(mismatches):,} books disagree with their open loans; rerun with --repair to rebuild.")
+                sys.exit(1)
+        elif args.delta:
+            migrate(conn)
+            start = time.perf_counter()
+            summary = import_delta(conn)
+            print_delta_summary(summary)
+            print(f"Catalogue delta applied in {time.perf_counter() - start:.2f}s.")
+        elif args.migrate:
+            migrate(conn)
+            print("Database schema and indexes are up to date.")
+        else:
+            load_all(conn)
+            print("Database refreshed using normalized CSVs.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Replay a mix of catalogue and circulation requests and report latency.
+
+By default requests go through Flask's test client in this process, against
+the database named by --db; with --url they go to a running server instead.
+Checkouts and check-ins really happen, so --db defaults to synthetic.py's
+output rather than the library database.
+
+    python synthetic.py --db scaled.db
+    python loadtest.py --db scaled.db --requests 5000 --concurrency 8
+    python loadtest.py --url http://127.0.0.1:5000 --requests 5000
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Optional, Tuple
+
+# (action, weight) of the request mix.
+MIX = (
+    ("search", 55),
+    ("loans", 20),
+    ("checkout", 10),
+    ("fines", 10),
+    ("checkin", 5),
+)
+PERCENTILES = (50, 90, 95, 99)
+# Requests under this prefix go to the JSON API and send JSON bodies.
+API_PREFIX = "/api/"
+
+
+class AppSession:
+    """Requests through the Flask test client (no network)."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, data: dict = None) -> Tuple[int, bytes]:
+        if path.startswith(API_PREFIX):
+            response = self.client.open(path, method=method, json=data)
+        else:
+            response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """Requests to a running server, keeping its session cookie."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method: str, path: str, data: dict = None) -> Tuple[int, bytes]:
+        headers = {}
+        body = None
+        if path.startswith(API_PREFIX) and data is not None:
+            body = json.dumps(data).encode()
+            headers["Content-Type"] = "application/json"
+        elif method == "POST":
+            body = urllib.parse.urlencode(data or {}, doseq=True).encode()
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+class Workload:
+    """Request parameters sampled from the database the app is serving."""
+
+    def __init__(self, db_path: Path, seed: int = 42, samples: int = 2000):
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        conn = sqlite3.connect(db_path)
+        max_rowid = conn.execute("SELECT MAX(rowid) FROM BOOK").fetchone()[0] or 0
+        rowids = [self.rng.randint(1, max_rowid) for _ in range(samples)] if max_rowid else []
+        self.books = conn.execute(
+            "SELECT Isbn, Title FROM BOOK WHERE rowid IN (SELECT value FROM json_each(?))",
+            (str(rowids),),
+        ).fetchall()
+        self.cards = [row[0] for row in conn.execute(
+            "SELECT Card_id FROM BORROWER ORDER BY random() LIMIT ?", (samples,)
+        )]
+        self.open_loans = [row[0] for row in conn.execute(
+            "SELECT Loan_id FROM BOOK_LOANS WHERE Date_in IS NULL LIMIT ?", (samples,)
+        )]
+        conn.close()
+        if not self.books or not self.cards:
+            raise ValueError(f"{db_path} has no books or borrowers to sample")
+
+    def next_request(self):
+        """Return (action, method, path, data) for one request of the mix."""
+        with self._lock:
+            action = self.rng.choices([a for a, _ in MIX], weights=[w for _, w in MIX])[0]
+            isbn, title = self.rng.choice(self.books)
+            card_id = self.rng.choice(self.cards)
+            if action == "checkin" and not self.open_loans:
+                action = "loans"
+            loan_id = self.open_loans.pop() if action == "checkin" else None
+            words = title.split()
+            term = isbn if self.rng.random() < 0.1 else " ".join(words[:self.rng.randint(1, 2)])
+
+        if action == "search":
+            return action, "GET", "/search?" + urllib.parse.urlencode({"q": term}), None
+        if action == "loans":
+            return action, "GET", f"/loans?q={card_id}&type=card_id", None
+        # Writes go through the JSON API, which reports each item's error;
+        # the HTML forms redirect with a flash message either way.
+        if action == "checkout":
+            return action, "POST", "/api/v1/loans", {"isbns": [isbn], "card_id": card_id}
+        if action == "fines":
+            return action, "GET", "/fines", None
+        return action, "POST", "/api/v1/loans/checkin", {"loan_ids": [loan_id]}
+
+
+def _failed(path: str, status: Optional[int], body: bytes) -> bool:
+    """Whether a request failed: transport error, 4xx/5xx, or an API item error."""
+    if status is None or status >= 400:
+        return True
+    if path.startswith(API_PREFIX) and status == 200:
+        return any(item.get("error") for item in json.loads(body).get("results", ()))
+    return False
+
+
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def run(make_session, workload: Workload, requests: int, concurrency: int,
+        username: str = "admin", password: str = "admin") -> dict:
+    """Issue ``requests`` requests from ``concurrency`` threads; returns latencies per action.
+
+    Every session logs in before any worker starts, so a bad password or an
+    unreachable server raises here instead of silently ending the threads.
+    Transport errors during the run count as errors of their action.
+    """
+    sessions = [make_session() for _ in range(concurrency)]
+    for session in sessions:
+        status, _ = session.request("POST", "/login", {"username": username, "password": password})
+        if status != 302:
+            raise RuntimeError(f"login failed with HTTP {status}")
+    results = {}
+    results_lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(session):
+        while True:
+            with results_lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            action, method, path, data = workload.next_request()
+            start = time.perf_counter()
+            try:
+                status, body = session.request(method, path, data)
+            except OSError:  # connection refused or reset, timeout (URLError is an OSError)
+                status, body = None, b""
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                latencies, errors = results.setdefault(action, ([], [0]))
+                latencies.append(elapsed)
+                if _failed(path, status, body):
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def print_report(results: dict, elapsed: float) -> None:
+    header = "".join(f"{f'p{p}':>9}" for p in PERCENTILES)
+    print(f"{'action':<10} {'count':>7} {'errors':>7}{header} {'max':>9}   (ms)")
+    everything = []
+    rows = sorted(results.items())
+    for action, (latencies, errors) in rows + [("overall", (None, None))]:
+        if action == "overall":
+            latencies = everything
+            errors = [sum(e[0] for _, e in results.values())]
+        else:
+            everything.extend(latencies)
+        values = sorted(latencies)
+        cells = "".join(f"{_percentile(values, p) * 1000:>9.1f}" for p in PERCENTILES)
+        print(f"{action:<10} {len(values):>7,} {errors[0]:>7,}{cells} {(values[-1] if values else 0) * 1000:>9.1f}")
+    print(f"throughput: {len(everything) / elapsed:,.1f} requests/s over {elapsed:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the library app with a mixed workload.")
+    parser.add_argument("--db", type=Path, default=Path("synthetic.db"),
+                        help="database to serve (in-process) or to sample parameters from; "
+                             "it receives real checkouts, so never point it at the library database")
+    parser.add_argument("--url", help="test a running server at this base URL instead of in-process")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if not args.db.exists():
+        parser.error(f"{args.db} does not exist; build one with synthetic.py --db {args.db}")
+
+    if args.url:
+        def make_session():
+            return HttpSession(args.url)
+    else:
+        # The app reads its database path at import time.
+        os.environ["LIBRARY_DB_PATH"] = str(args.db)
+        from app import app
+
+        def make_session():
+            return AppSession(app)
+
+    workload = Workload(args.db, args.seed)
+    start = time.perf_counter()
+    try:
+        results = run(make_session, workload, args.requests, args.concurrency, args.username, args.password)
+    except (RuntimeError, OSError) as error:
+        print(f"loadtest: {error}", file=sys.stderr)
+        raise SystemExit(1)
+    print_report(results, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
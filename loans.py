@@ -1,7 +1,9 @@
+import json
 from datetime import date, timedelta
 from typing import List, Optional
 
 from db import db_transaction
+from searchcache import CACHE as SEARCH_CACHE
 
 MAX_ACTIVE_LOANS = 3
 
@@ -19,6 +21,142 @@ JOIN BOOK b   ON bl.Isbn = b.Isbn
 JOIN BORROWER bor ON bl.Card_id = bor.Card_id
 """
 
+# BOOK.Current_loan_id / Current_card_id hold each book's open loan (the
+# latest, should there ever be several) so catalogue pages read availability
+# from BOOK instead of probing BOOK_LOANS per row.  The triggers keep them in
+# step with BOOK_LOANS; rebuild_availability() backfills them.
+CURRENT_LOAN_EXPR = """
+(SELECT bl.Loan_id, bl.Card_id
+ FROM BOOK_LOANS bl
+ WHERE bl.Isbn = {isbn} AND bl.Date_in IS NULL
+ ORDER BY bl.Loan_id DESC
+ LIMIT 1)
+"""
+
+AVAILABILITY_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS BOOK_AVAILABILITY_LOANS_AI
+AFTER INSERT ON BOOK_LOANS WHEN NEW.Date_in IS NULL BEGIN
+    UPDATE BOOK SET (Current_loan_id, Current_card_id) = {new_current}
+    WHERE Isbn = NEW.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_AVAILABILITY_LOANS_AU
+AFTER UPDATE OF Isbn, Card_id, Date_in ON BOOK_LOANS
+WHEN OLD.Date_in IS NULL OR NEW.Date_in IS NULL BEGIN
+    UPDATE BOOK SET (Current_loan_id, Current_card_id) = {old_current}
+    WHERE Isbn = OLD.Isbn;
+    UPDATE BOOK SET (Current_loan_id, Current_card_id) = {new_current}
+    WHERE Isbn = NEW.Isbn AND NEW.Isbn IS NOT OLD.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_AVAILABILITY_LOANS_AD
+AFTER DELETE ON BOOK_LOANS WHEN OLD.Date_in IS NULL BEGIN
+    UPDATE BOOK SET (Current_loan_id, Current_card_id) = {old_current}
+    WHERE Isbn = OLD.Isbn;
+END;
+""".format(
+    new_current=CURRENT_LOAN_EXPR.format(isbn="NEW.Isbn"),
+    old_current=CURRENT_LOAN_EXPR.format(isbn="OLD.Isbn"),
+)
+
+AVAILABILITY_TRIGGER_NAMES = (
+    "BOOK_AVAILABILITY_LOANS_AI",
+    "BOOK_AVAILABILITY_LOANS_AU",
+    "BOOK_AVAILABILITY_LOANS_AD",
+)
+
+# Books whose stored availability differs from their open loans.
+AVAILABILITY_MISMATCHES = """
+SELECT
+    b.Isbn,
+    b.Current_loan_id,
+    b.Current_card_id,
+    cur.Loan_id AS Expected_loan_id,
+    cur.Card_id AS Expected_card_id
+FROM BOOK b
+LEFT JOIN BOOK_LOANS cur ON cur.Loan_id = (
+    SELECT MAX(bl.Loan_id) FROM BOOK_LOANS bl WHERE bl.Isbn = b.Isbn AND bl.Date_in IS NULL
+)
+WHERE b.Current_loan_id IS NOT cur.Loan_id
+   OR b.Current_card_id IS NOT cur.Card_id
+ORDER BY b.Isbn
+"""
+
+
+def rebuild_availability(conn) -> None:
+    """Backfill BOOK's current-loan columns from BOOK_LOANS and install their triggers.
+
+    Runs as one script transaction so no checkout can slip in between the
+    backfill and the triggers.
+    """
+    drops = "".join(f"DROP TRIGGER IF EXISTS {name};\n" for name in AVAILABILITY_TRIGGER_NAMES)
+    conn.executescript(
+        f"""
+        BEGIN IMMEDIATE;
+        {drops}
+        UPDATE BOOK SET Current_loan_id = NULL, Current_card_id = NULL
+        WHERE Current_loan_id IS NOT NULL OR Current_card_id IS NOT NULL;
+        UPDATE BOOK SET (Current_loan_id, Current_card_id) = {CURRENT_LOAN_EXPR.format(isbn="BOOK.Isbn")}
+        WHERE Isbn IN (SELECT Isbn FROM BOOK_LOANS WHERE Date_in IS NULL);
+        {AVAILABILITY_TRIGGERS}
+        COMMIT;
+        """
+    )
+
+
+def ensure_availability(conn) -> None:
+    """Add and backfill the current-loan columns on databases that predate them."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(BOOK)")}
+    for column in ("Current_loan_id", "Current_card_id"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE BOOK ADD COLUMN {column} INTEGER")
+    installed = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+    }
+    if not installed.issuperset(AVAILABILITY_TRIGGER_NAMES):
+        rebuild_availability(conn)
+    conn.commit()
+
+
+def check_availability(conn) -> List[dict]:
+    """Return every book whose Current_loan_id/Current_card_id disagree with BOOK_LOANS."""
+    return [dict(row) for row in conn.execute(AVAILABILITY_MISMATCHES).fetchall()]
+
+
+def book_availability(conn, isbns: List[str]) -> List[dict]:
+    """Look up several books' availability in one query.
+
+    Returns one ``{"isbn", "title", "status", "loan_id", "card_id", "error"}``
+    dict per requested ISBN, in order; ``status`` is ``IN`` or ``OUT``.
+    """
+    isbns = [(isbn or "").strip() for isbn in isbns]
+    books = {
+        row["Isbn"]: row
+        for row in conn.execute(
+            """
+            SELECT Isbn, Title, Current_loan_id, Current_card_id FROM BOOK
+            WHERE Isbn IN (SELECT value FROM json_each(?))
+            """,
+            (json.dumps(sorted({isbn for isbn in isbns if isbn})),),
+        )
+    }
+    results = []
+    for isbn in isbns:
+        row = books.get(isbn)
+        if row is None:
+            results.append({"isbn": isbn, "title": None, "status": None, "loan_id": None,
+                            "card_id": None, "error": "Book not found" if isbn else "ISBN is required"})
+            continue
+        results.append({
+            "isbn": isbn,
+            "title": row["Title"],
+            "status": "IN" if row["Current_loan_id"] is None else "OUT",
+            "loan_id": row["Current_loan_id"],
+            "card_id": row["Current_card_id"],
+            "error": None,
+        })
+    return results
+
 
 def checkout(conn, isbn: str, card_id: int, override_restrictions: bool = False) -> int:
     isbn = (isbn or "").strip()
@@ -72,7 +210,121 @@ def checkout(conn, isbn: str, card_id: int, override_restrictions: bool = False)
             """,
             (isbn, card_id, today.isoformat(), due.isoformat()),
         )
-        return cursor.lastrowid
+        loan_id = cursor.lastrowid
+    SEARCH_CACHE.book_status(isbn, card_id)
+    return loan_id
+
+
+def checkout_many(
+    conn,
+    isbns: List[str],
+    card_id: int,
+    override_restrictions: bool = False,
+    all_or_nothing: bool = False,
+) -> List[dict]:
+    """Check out several ISBNs to one borrower in a single transaction.
+
+    The borrower and fine checks run once and availability is looked up for
+    all ISBNs in one query.  Returns one ``{"isbn", "loan_id", "error"}``
+    dict per requested ISBN, in order.  In best-effort mode every valid ISBN
+    is checked out; with ``all_or_nothing`` a single failure cancels the
+    whole batch.  Borrower-level failures raise ValueError.
+    """
+    card_id = int(card_id)
+    isbns = [(isbn or "").strip() for isbn in isbns]
+    if not any(isbns):
+        raise ValueError("ISBN is required")
+
+    today = date.today()
+    due = today + timedelta(days=14)
+    wanted = json.dumps(sorted({isbn for isbn in isbns if isbn}))
+
+    with db_transaction(conn):
+        cursor = conn.cursor()
+
+        if not cursor.execute("SELECT 1 FROM BORROWER WHERE Card_id = ?", (card_id,)).fetchone():
+            raise ValueError("Borrower not found")
+
+        active_loans = 0
+        if not override_restrictions:
+            active_loans = cursor.execute(
+                "SELECT COUNT(*) FROM BOOK_LOANS WHERE Card_id = ? AND Date_in IS NULL",
+                (card_id,),
+            ).fetchone()[0]
+
+            unpaid_fines = cursor.execute(
+                """
+                SELECT COUNT(*)
+                FROM FINES f
+                JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+                WHERE bl.Card_id = ? AND f.Paid = 0
+                """,
+                (card_id,),
+            ).fetchone()[0]
+            if unpaid_fines:
+                raise ValueError("Borrower has unpaid fines")
+
+        rows = cursor.execute(
+            """
+            SELECT b.Isbn, b.Current_loan_id IS NOT NULL AS Is_out
+            FROM BOOK b
+            WHERE b.Isbn IN (SELECT value FROM json_each(?))
+            """,
+            (wanted,),
+        ).fetchall()
+        unavailable = {row["Isbn"] for row in rows if row["Is_out"]}
+        known = {row["Isbn"] for row in rows}
+
+        results = []
+        to_insert = []
+        for isbn in isbns:
+            error = None
+            if not isbn:
+                error = "ISBN is required"
+            elif isbn not in known:
+                error = "Book not found"
+            elif not override_restrictions and active_loans >= MAX_ACTIVE_LOANS:
+                error = "Borrower already has 3 books checked out"
+            elif isbn in unavailable:
+                error = "Book is currently checked out"
+            else:
+                unavailable.add(isbn)
+                active_loans += 1
+                to_insert.append((isbn, card_id, today.isoformat(), due.isoformat()))
+            results.append({"isbn": isbn, "loan_id": None, "error": error})
+
+        if all_or_nothing and any(result["error"] for result in results):
+            for result in results:
+                if not result["error"]:
+                    result["error"] = "Batch cancelled: another ISBN could not be checked out"
+            return results
+
+        if to_insert:
+            cursor.executemany(
+                """
+                INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Date_in)
+                VALUES (?, ?, ?, ?, NULL)
+                """,
+                to_insert,
+            )
+            # Each ISBN has at most one open loan, so this maps them back to ids.
+            inserted = [row[0] for row in to_insert]
+            loan_ids = dict(
+                cursor.execute(
+                    f"""
+                    SELECT Isbn, Loan_id FROM BOOK_LOANS
+                    WHERE Card_id = ? AND Date_in IS NULL
+                      AND Isbn IN ({", ".join("?" for _ in inserted)})
+                    """,
+                    [card_id] + inserted,
+                ).fetchall()
+            )
+            for result in results:
+                if not result["error"]:
+                    result["loan_id"] = loan_ids[result["isbn"]]
+    for isbn, _, _, _ in to_insert:
+        SEARCH_CACHE.book_status(isbn, card_id)
+    return results
 
 
 def find_open_loans(
@@ -112,7 +364,7 @@ def checkin(conn, loan_id: int) -> None:
     with db_transaction(conn):
         cursor = conn.cursor()
         row = cursor.execute(
-            "SELECT Date_in FROM BOOK_LOANS WHERE Loan_id = ?",
+            "SELECT Isbn, Date_in FROM BOOK_LOANS WHERE Loan_id = ?",
             (loan_id,),
         ).fetchone()
         if not row:
@@ -127,9 +379,66 @@ def checkin(conn, loan_id: int) -> None:
 
         from fines import refresh_fines
         refresh_fines(conn, loan_id=loan_id)
+    SEARCH_CACHE.book_status(row["Isbn"], None)
+
+
+def checkin_many(conn, loan_ids: List[int]) -> List[dict]:
+    """Check in a batch of loans with one UPDATE and one fine recalculation.
+
+    Returns one ``{"loan_id", "error"}`` dict per requested id, in order.
+    Valid loans are closed even when others in the batch fail.
+    """
+    loan_ids = [int(loan_id) for loan_id in loan_ids]
+    today = date.today().isoformat()
+    ids_json = json.dumps(sorted(set(loan_ids)))
+
+    with db_transaction(conn):
+        cursor = conn.cursor()
+        rows = cursor.execute(
+            """
+            SELECT Loan_id, Isbn, Date_in FROM BOOK_LOANS
+            WHERE Loan_id IN (SELECT value FROM json_each(?))
+            """,
+            (ids_json,),
+        ).fetchall()
+        open_state = {row["Loan_id"]: row["Date_in"] is None for row in rows}
+        isbns = {row["Loan_id"]: row["Isbn"] for row in rows}
+
+        results = []
+        closing = []
+        for loan_id in loan_ids:
+            error = None
+            if loan_id not in open_state:
+                error = "Loan not found"
+            elif not open_state[loan_id]:
+                error = "Loan already closed"
+            else:
+                open_state[loan_id] = False
+                closing.append(loan_id)
+            results.append({"loan_id": loan_id, "error": error})
+
+        if closing:
+            cursor.execute(
+                """
+                UPDATE BOOK_LOANS SET Date_in = ?
+                WHERE Loan_id IN (SELECT value FROM json_each(?))
+                """,
+                (today, json.dumps(closing)),
+            )
+
+            from fines import refresh_fines
+            refresh_fines(conn, loan_ids=closing)
+    for loan_id in closing:
+        SEARCH_CACHE.book_status(isbns[loan_id], None)
+    return results
 
 
 def checkin_multiple(conn, loan_ids: List[int]) -> None:
     """Check in 1–3 loans in a single action."""
-    for loan_id in loan_ids:
-        checkin(conn, loan_id)
+    errors = [
+        f"Loan {result['loan_id']}: {result['error']}"
+        for result in checkin_many(conn, loan_ids)
+        if result["error"]
+    ]
+    if errors:
+        raise ValueError("; ".join(errors))
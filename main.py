@@ -1,7 +1,7 @@
 from db import get_connection
 from load_data import load_all
-from search import search_books
-from loans import checkout, find_open_loans, checkin, checkin_multiple
+from searchcache import search_books
+from loans import checkout, find_open_loans, checkin_many
 from borrowers import create_borrower
 from fines import refresh_fines, list_outstanding_fines, pay_fines
 
@@ -138,11 +138,12 @@ def handle_checkin(conn):
         print("You must enter between 1 and 3 Loan IDs.")
         return
 
-    try:
-        checkin_multiple(conn, loan_ids)
-        print("Check-in complete.")
-    except ValueError as err:
-        print(f"Check-in failed: {err}")
+    results = checkin_many(conn, loan_ids)
+    for result in results:
+        if result["error"]:
+            print(f"Loan {result['loan_id']}: check-in failed: {result['error']}")
+        else:
+            print(f"Loan {result['loan_id']}: checked in.")
 
 
 def handle_create_borrower(conn):
@@ -167,8 +168,8 @@ def handle_show_fines(conn):
 
 
 def handle_refresh_fines(conn):
-    refresh_fines(conn)
-    print("Fines refreshed.")
+    written = refresh_fines(conn, incremental=True)
+    print(f"Fines refreshed ({written} updated).")
 
 
 def handle_pay_fines(conn):
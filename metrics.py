@@ -0,0 +1,218 @@
+"""In-process metrics served at /metrics in the Prometheus text format.
+
+Request hooks record per-endpoint latency, status codes, requests in flight
+and the database time each request spent; the routes add domain counters
+(checkouts, check-ins, fines refreshed, searches).  Everything lives in
+REGISTRY and is rendered on scrape, so no external service is involved.
+"""
+import threading
+import time
+from typing import Callable, Dict, Sequence, Tuple
+
+from flask import Response, g, request
+
+import querystats
+
+# Upper bounds, in seconds, for request and database-time histograms.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def _key(self, labels: dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return "\n".join(lines)
+
+    def _samples(self, key: Tuple, value):
+        yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 function: Callable[[], Dict[Tuple, float]] = None):
+        super().__init__(name, help, labelnames)
+        self._function = function
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> str:
+        if self._function is not None:
+            values = self._function()
+            with self._lock:
+                self._values = dict(values)
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, key: Tuple, value):
+        counts, total, count = value
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = 'le="' + _number(bound) + '"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+        yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+        yield f"{self.name}_count{_labels(self.labelnames, key)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Add ``metric``, replacing any registered metric of the same name."""
+        for i, existing in enumerate(self._metrics):
+            if existing.name == metric.name:
+                self._metrics[i] = metric
+                return metric
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "library_http_request_duration_seconds", "Time spent handling a request.", ("endpoint", "method")))
+REQUESTS = REGISTRY.register(Counter(
+    "library_http_requests_total", "Requests handled, by status code.", ("endpoint", "method", "status")))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "library_http_requests_in_flight", "Requests currently being handled."))
+REQUEST_DB_TIME = REGISTRY.register(Histogram(
+    "library_http_request_db_seconds", "Database time spent per request.", ("endpoint",)))
+REQUEST_DB_STATEMENTS = REGISTRY.register(Histogram(
+    "library_http_request_db_statements", "SQL statements run per request.", ("endpoint",),
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100)))
+
+CHECKOUTS = REGISTRY.register(Counter(
+    "library_checkouts_total", "Checkout attempts, by outcome.", ("outcome",)))
+CHECKINS = REGISTRY.register(Counter(
+    "library_checkins_total", "Check-in attempts, by outcome.", ("outcome",)))
+FINES_REFRESHED = REGISTRY.register(Counter(
+    "library_fines_refreshed_total", "Fine rows written by refreshes."))
+SEARCHES = REGISTRY.register(Counter(
+    "library_search_queries_total", "Catalogue searches, by how they were answered.", ("mode",)))
+SEARCH_CACHE = REGISTRY.register(Counter(
+    "library_search_cache_lookups_total", "Search result cache lookups, by result.", ("result",)))
+SEARCH_CACHE_EVICTIONS = REGISTRY.register(Counter(
+    "library_search_cache_evictions_total", "Search results evicted to stay within the cache caps."))
+
+
+def _endpoint() -> str:
+    return request.endpoint or "unmatched"
+
+
+def _before_request() -> None:
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc()
+    querystats.start_scope()
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc=None) -> None:
+    if "metrics_start" not in g:
+        return
+    elapsed = time.perf_counter() - g.pop("metrics_start")
+    status = g.pop("metrics_status", 500)
+    statements, db_seconds = querystats.end_scope()
+    endpoint = _endpoint()
+    IN_FLIGHT.dec()
+    REQUEST_LATENCY.observe(elapsed, endpoint=endpoint, method=request.method)
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+    REQUEST_DB_TIME.observe(db_seconds, endpoint=endpoint)
+    REQUEST_DB_STATEMENTS.observe(statements, endpoint=endpoint)
+
+
+def metrics_view():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app, pool=None) -> None:
+    """Install the request hooks and the /metrics route on ``app``."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    if pool is not None:
+        # Re-initializing (another app, a new pool) replaces the gauge.
+        REGISTRY.register(Gauge(
+            "library_db_pool_connections", "Pooled database connections, by state.", ("state",),
+            function=lambda: {("open",): pool.opened, ("idle",): pool.idle},
+        ))
@@ -1,7 +1,12 @@
+import argparse
+import io
+import os
 import pandas as pd
 import sys
 import re
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 def normalize_author_names(name):
     if not isinstance(name, str):
@@ -15,58 +20,71 @@ def find_col_indx(header_list, possible_names):
             return header_list[header_lower.index(name.lower())]
     return None
 
+def join_nonempty(parts, separator, index):
+    """Column-wise ``separator.join(filter(None, row))`` over string Series."""
+    joined = pd.Series('', index=index, dtype=object)
+    for part in parts:
+        gap = np.where((joined != '') & (part != ''), separator, '')
+        joined = joined + gap + part
+    return joined
+
+
+def prepare_borrowers(df):
+    """Map a raw borrower frame onto BORROWER's columns."""
+    cols = list(df.columns)
+    card_col = find_col_indx(cols, ['id', 'card_id', 'cardid', 'id0000id'])
+    ssn_col = find_col_indx(cols, ['ssn', 'social_security_number', 'social_security'])
+    first_name_col = find_col_indx(cols, ['first_name', 'firstname', 'first'])
+    last_name_col = find_col_indx(cols, ['last_name', 'lastname', 'last'])
+    address_col = find_col_indx(cols, ['address', 'addr', 'street'])
+    city_col = find_col_indx(cols, ['city', 'town'])
+    state_col = find_col_indx(cols, ['state', 'province'])
+    phone_col = find_col_indx(cols, ['phone', 'phone_number', 'telephone'])
+
+    rename_map = {
+        card_col: 'Card_id',
+        ssn_col: 'Ssn',
+        first_name_col: 'first_name',
+        last_name_col: 'last_name',
+        address_col: 'Address_street',
+        city_col: 'City',
+        state_col: 'State',
+        phone_col: 'Phone',
+    }
+
+    rename_map = {k: v for k, v in rename_map.items() if k is not None}
+
+    if 'Card_id' not in rename_map.values() or 'Ssn' not in rename_map.values():
+        raise ValueError("Essential columns missing in input file.")
+
+    df = df.rename(columns=rename_map)
+
+    df['Card_id'] = df['Card_id'].str.strip()
+    df['Ssn'] = df['Ssn'].str.strip()
+
+    first = df['first_name'].str.title().fillna('') if 'first_name' in df else ''
+    last = df['last_name'].str.title().fillna('') if 'last_name' in df else ''
+    df['Bname'] = (first + ' ' + last).str.strip()
+
+    df['Address'] = join_nonempty(
+        [df[col].fillna('') for col in ('Address_street', 'City', 'State') if col in df],
+        ', ',
+        df.index,
+    )
+
+    final_cols = ['Card_id']
+    if 'Ssn' in df:
+        final_cols.append('Ssn')
+    final_cols.extend(['Bname', 'Address'])
+    if 'Phone' in df:
+        final_cols.append('Phone')
+
+    return df[final_cols]
+
+
 def normalize_Borrowers(inputFile="borrowers.csv", outputFile="normalized_borrowers.csv"):
     try:
-        df = pd.read_csv(inputFile, dtype=str)
-
-        cols = list(df.columns)
-        card_col = find_col_indx(cols, ['id', 'card_id', 'cardid', 'id0000id'])
-        ssn_col = find_col_indx(cols, ['ssn', 'social_security_number', 'social_security'])
-        first_name_col = find_col_indx(cols, ['first_name', 'firstname', 'first'])
-        last_name_col = find_col_indx(cols, ['last_name', 'lastname', 'last'])
-        address_col = find_col_indx(cols, ['address', 'addr', 'street'])
-        city_col = find_col_indx(cols, ['city', 'town'])
-        state_col = find_col_indx(cols, ['state', 'province'])
-        phone_col = find_col_indx(cols, ['phone', 'phone_number', 'telephone'])
-
-        rename_map = {
-            card_col: 'Card_id',
-            ssn_col: 'Ssn',
-            first_name_col: 'first_name',
-            last_name_col: 'last_name',
-            address_col: 'Address_street',
-            city_col: 'City',
-            state_col: 'State',
-            phone_col: 'Phone',
-        }
-
-        rename_map = {k: v for k, v in rename_map.items() if k is not None}
-
-        if 'Card_id' not in rename_map.values() or 'Ssn' not in rename_map.values():
-            raise ValueError("Essential columns missing in input file.")
-    
-        df = df.rename(columns=rename_map)
-
-        first = df['first_name'].str.title().fillna('') if 'first_name' in df else ''
-        last = df['last_name'].str.title().fillna('') if 'last_name' in df else ''
-        df['Bname'] = (first + ' ' + last).str.strip()
-
-        addr_part = [
-            df['Address_street'].fillna('') if 'Address_street' in df else '',
-            df['City'].fillna('') if 'City' in df else '',
-            df['State'].fillna('') if 'State' in df else ''
-        ]
-
-        df['Address'] = pd.DataFrame(addr_part).T.apply(lambda x: ', '.join(filter(None, x)), axis=1)
-
-        final_cols = ['Card_id']
-        if 'Ssn' in df:
-            final_cols.append('Ssn')
-        final_cols.extend(['Bname', 'Address'])
-        if 'Phone' in df:
-            final_cols.append('Phone')
-        
-        df = df[final_cols]
+        df = prepare_borrowers(pd.read_csv(inputFile, dtype=str))
         df.to_csv(outputFile, index=False)
         print(f"Normalized borrowers data written to {outputFile}")
 
@@ -78,53 +96,184 @@ def normalize_Borrowers(inputFile="borrowers.csv", outputFile="normalized_borrow
         return
     
 
-def normalize_Books(inputFile="books.csv", outputFile="normalized_books.csv"):
+# Default rows per chunk for --chunksize.
+BOOKS_CHUNKSIZE = 100000
 
-    try:
-        df = pd.read_csv(inputFile, dtype= str, sep='\t')
+# Upper bound on the bytes of books.csv each --workers task parses; the
+# file is split into at least one shard per worker.
+SHARD_BYTES = 32 * 1024 * 1024
 
-        isbn_col = 'ISBN10'
 
-        if isbn_col not in df.columns:
-            if 'isbn13' in df.columns:
-                df['ISBN10'] = df['isbn13']
-            else:
-                raise ValueError("No ISBN column found in input file.")
-                return
+def _book_columns(df):
+    isbn_col = 'ISBN10'
 
-        df = df.rename(columns={isbn_col: 'Isbn', 'title': 'Title', 'author': 'Author'})
+    if isbn_col not in df.columns:
+        if 'isbn13' in df.columns:
+            df['ISBN10'] = df['isbn13']
+        else:
+            raise ValueError("No ISBN column found in input file.")
 
-        df['Title'] = df['Title'].str.title()
-        df_book = df[['Isbn', 'Title']].drop_duplicates(subset=['Isbn'])
-        df_book.to_csv(outputFile, index=False)
-        print(f"Normalized books data written to {outputFile}")
+    return df.rename(columns={isbn_col: 'Isbn', 'title': 'Title', 'author': 'Author'})
+
+
+def prepare_books_chunk(df):
+    """Normalize one chunk of raw book rows into (books, links) frames.
+
+    ``links`` has one row per book/author pair with the stripped and the
+    normalized author name.  Nothing here depends on other chunks.
+    """
+    df = _book_columns(df)
+
+    books = pd.DataFrame({'Isbn': df['Isbn'], 'Title': df['Title'].str.title()})
+    books = books.drop_duplicates(subset=['Isbn'])
+
+    links = df[['Isbn', 'Author']].copy()
+    links['Author'] = links['Author'].str.split(',')
+    links = links.explode('Author').fillna('')
+    # Vectorized normalize_author_names(), run once per distinct spelling
+    # since the same names recur throughout a catalogue.
+    codes, names = pd.factorize(links['Author'])
+    stripped = names.str.strip()
+    links['Original_Name'] = stripped.take(codes).to_numpy()
+    links['Normalized_Name'] = stripped.str.lower().str.replace(r'\s+', ' ', regex=True).take(codes).to_numpy()
+    links = links[links['Normalized_Name'] != '']
+    return books, links[['Isbn', 'Original_Name', 'Normalized_Name']]
 
-        df_junction = df[['Isbn', 'Author']].copy()
-        df_junction['Author'] = df_junction['Author'].str.split(',')
-        df_junction = df_junction.explode('Author').fillna('')
 
-        df_junction['Normalized_Name'] = df_junction['Author'].apply(normalize_author_names)
-        df_junction['Original_Name'] = df_junction['Author'].str.strip()
+class BookMerger:
+    """Merge prepared chunks into globally deduplicated catalogue frames.
 
-        unique_authors_df = df_junction[df_junction['Normalized_Name'] != '']
-        unique_authors_df = unique_authors_df.drop_duplicates(subset=['Normalized_Name'])
+    Author_ids are assigned in order of first appearance and stay stable
+    across chunks.  A book's author links are kept from every chunk its ISBN
+    appears in, minus the pairs already written.  Between chunks only each
+    ISBN's author ids and the author names are kept, so memory grows with the
+    number of distinct books and authors rather than the input size.
+    """
 
-        df_authors_final = unique_authors_df[['Original_Name']].copy()
-        df_authors_final = df_authors_final.rename(columns={'Original_Name': 'Name'})
-        df_authors_final = df_authors_final.reset_index(drop=True)
-        df_authors_final['Name'] = df_authors_final['Name'].str.title()
-        df_authors_final.insert(0, 'Author_id', range(1, len(df_authors_final) + 1))
+    def __init__(self):
+        self.author_ids = {}
+        self.isbn_authors = {}  # Isbn -> tuple of the Author_ids linked so far
 
-        df_authors_final.to_csv("authors.csv", index=False)
-        print(f"Normalized authors data written to authors.csv")
+    def merge(self, books, links):
+        """Return the (books, authors, book_authors) rows new in this chunk."""
+        isbns = books['Isbn'].tolist()
+        keep = [isbn not in self.isbn_authors for isbn in isbns]
+        books = books[keep]
 
-        author_name_to_id = df_authors_final.set_index(df_authors_final['Name'].apply(normalize_author_names))['Author_id']
-        df_junction['Author_id'] = df_junction['Normalized_Name'].map(author_name_to_id)
-        df_final_junction = df_junction.dropna(subset=['Author_id']).copy()
-        df_final_junction['Author_id'] = df_final_junction['Author_id'].astype(int)
-        df_final_junction = df_final_junction[['Isbn', 'Author_id']].drop_duplicates()
-        df_final_junction.to_csv("book_authors.csv", index=False)
-        print(f"Normalized book-author mapping data written to book_authors.csv")
+        first = links.drop_duplicates(subset=['Normalized_Name'])
+        first = first[first['Normalized_Name'].map(self.author_ids).isna()]
+        start = len(self.author_ids) + 1
+        authors = pd.DataFrame({
+            'Author_id': range(start, start + len(first)),
+            'Name': first['Original_Name'].str.title().to_numpy(),
+        })
+        self.author_ids.update(zip(first['Normalized_Name'].tolist(), authors['Author_id'].tolist()))
+
+        book_authors = pd.DataFrame({
+            'Isbn': links['Isbn'],
+            'Author_id': links['Normalized_Name'].map(self.author_ids).astype(int),
+        }).drop_duplicates()
+        keep = []
+        added = {}
+        for isbn, author_id in zip(book_authors['Isbn'].tolist(), book_authors['Author_id'].tolist()):
+            fresh = author_id not in self.isbn_authors.get(isbn, ())
+            keep.append(fresh)
+            if fresh:
+                added.setdefault(isbn, []).append(author_id)
+        book_authors = book_authors[keep]
+        for isbn in isbns:
+            self.isbn_authors.setdefault(isbn, ())
+        for isbn, author_ids in added.items():
+            self.isbn_authors[isbn] = self.isbn_authors.get(isbn, ()) + tuple(author_ids)
+        return books, authors, book_authors
+
+
+def read_books(inputFile="books.csv", chunksize=None):
+    """Yield raw book frames, one per chunk (a single frame when chunksize is None)."""
+    if chunksize:
+        yield from pd.read_csv(inputFile, dtype=str, sep='\t', chunksize=chunksize)
+    else:
+        yield pd.read_csv(inputFile, dtype=str, sep='\t')
+
+
+def shard_ranges(inputFile, shards):
+    """Split a one-record-per-line file into byte ranges on line boundaries.
+
+    Returns (header, [(start, end), ...]) covering every line after the header.
+    """
+    size = os.path.getsize(inputFile)
+    with open(inputFile, 'rb') as handle:
+        header = handle.readline()
+        data_start = handle.tell()
+        step = max((size - data_start) // max(shards, 1), 1)
+        bounds = [data_start]
+        for target in range(data_start + step, size, step):
+            if target <= bounds[-1]:
+                continue
+            handle.seek(target - 1)
+            handle.readline()  # finish the line straddling the target
+            if handle.tell() >= size:
+                break
+            if handle.tell() > bounds[-1]:
+                bounds.append(handle.tell())
+        bounds.append(size)
+    return header, list(zip(bounds, bounds[1:]))
+
+
+def _prepare_books_shard(inputFile, header, start, end):
+    with open(inputFile, 'rb') as handle:
+        handle.seek(start)
+        data = handle.read(end - start)
+    text = (header + data).decode('utf-8')
+    return prepare_books_chunk(pd.read_csv(io.StringIO(text), dtype=str, sep='\t'))
+
+
+def prepared_books(inputFile="books.csv", chunksize=None, workers=1):
+    """Yield prepare_books_chunk() results for the input, in file order.
+
+    With ``workers`` > 1 the file is cut into byte-range shards that are
+    prepared in a process pool; at most two shards per worker are in
+    flight, so memory stays bounded while the merge catches up.
+    """
+    if workers <= 1:
+        for chunk in read_books(inputFile, chunksize):
+            yield prepare_books_chunk(chunk)
+        return
+
+    shards = max(workers, -(-os.path.getsize(inputFile) // SHARD_BYTES))
+    header, ranges = shard_ranges(inputFile, shards)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(_prepare_books_shard, inputFile, header, start, end))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def normalize_Books(inputFile="books.csv", outputFile="normalized_books.csv", chunksize=None,
+                    authorsFile="authors.csv", bookAuthorsFile="book_authors.csv", workers=1):
+    """Write the book, author and book-author CSVs.
+
+    With ``chunksize`` the input is streamed and each output is appended to
+    chunk by chunk; with ``workers`` the chunks are byte-range shards
+    prepared in parallel.  Chunks are always merged in file order, so the
+    files are identical to a whole-file run either way.
+    """
+    try:
+        merger = BookMerger()
+        paths = (outputFile, authorsFile, bookAuthorsFile)
+        first = True
+        for books, links in prepared_books(inputFile, chunksize, workers):
+            frames = merger.merge(books, links)
+            for frame, path in zip(frames, paths):
+                frame.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+            first = False
+
+        print(f"Normalized books data written to {outputFile}")
+        print(f"Normalized authors data written to {authorsFile}")
+        print(f"Normalized book-author mapping data written to {bookAuthorsFile}")
 
     except FileNotFoundError:
         print(f"Input file {inputFile} not found.", file=sys.stderr)
@@ -137,8 +286,22 @@ def normalize_Books(inputFile="books.csv", outputFile="normalized_books.csv"):
         return
 
 if __name__ == "__main__":
-    print("normalizing borrowers...")
-    normalize_Borrowers(inputFile="borrowers.csv", outputFile="borrower.csv")
-    print("normalizing books...")
-    normalize_Books(inputFile="books.csv", outputFile="book.csv")
+    parser = argparse.ArgumentParser(description="Normalize the raw borrower and book files.")
+    parser.add_argument("--chunksize", type=int, nargs="?", const=BOOKS_CHUNKSIZE,
+                        help=f"stream books.csv in chunks of this many rows (default {BOOKS_CHUNKSIZE})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="prepare books.csv shards in this many processes, alongside the borrowers")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(1) as borrower_pool:
+            print("normalizing borrowers and books...")
+            borrowers = borrower_pool.submit(normalize_Borrowers, inputFile="borrowers.csv", outputFile="borrower.csv")
+            normalize_Books(inputFile="books.csv", outputFile="book.csv", workers=args.workers)
+            borrowers.result()
+    else:
+        print("normalizing borrowers...")
+        normalize_Borrowers(inputFile="borrowers.csv", outputFile="borrower.csv")
+        print("normalizing books...")
+        normalize_Books(inputFile="books.csv", outputFile="book.csv", chunksize=args.chunksize)
     print("Normalization complete.")
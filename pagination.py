@@ -0,0 +1,141 @@
+"""Keyset (seek) pagination shared by the catalogue search and borrower listing.
+
+Instead of ``LIMIT ? OFFSET ?`` each page continues from the sort key of the
+last row shown, so SQLite seeks straight to it rather than generating and
+discarding every earlier row.  Page position travels in an opaque cursor
+token; the total is a capped count taken once on the first page and carried
+forward in the token.
+"""
+import base64
+import json
+from typing import List, Optional, Sequence, Tuple
+
+# Counting stops here; larger result sets are reported as "more than COUNT_CAP".
+COUNT_CAP = 10000
+
+
+class Page:
+    def __init__(self, rows: List[dict], number: int, total: Optional[int],
+                 next_cursor: Optional[str], prev_cursor: Optional[str]):
+        self.rows = rows
+        self.number = number
+        self.total = total
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def total_is_capped(self) -> bool:
+        return self.total is not None and self.total > COUNT_CAP
+
+
+def encode_cursor(key: Sequence, forward: bool, number: int, total: Optional[int]) -> str:
+    payload = {"k": list(key), "f": forward, "n": number, "t": total}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: Optional[str]) -> Optional[dict]:
+    """Return the decoded cursor, or None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict):
+        return None
+    key, forward, number, total = (payload.get(name) for name in ("k", "f", "n", "t"))
+    if not isinstance(key, list) or not all(_is_key_value(value) for value in key):
+        return None
+    if not isinstance(forward, bool) or not _is_int(number) or not (total is None or _is_int(total)):
+        return None
+    return payload
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_key_value(value) -> bool:
+    """True for values SQLite can bind as a sort key: str, int, float or None."""
+    return value is None or isinstance(value, (str, float)) or _is_int(value)
+
+
+def seek_clause(columns: Sequence[str], forward: bool, descending: bool = False) -> Tuple[str, str]:
+    """Return (condition, order_by) that continue past a cursor key on ``columns``."""
+    ascending = forward != descending
+    placeholders = ", ".join("?" for _ in columns)
+    condition = f"({', '.join(columns)}) {'>' if ascending else '<'} ({placeholders})"
+    direction = "ASC" if ascending else "DESC"
+    order_by = ", ".join(f"{column} {direction}" for column in columns)
+    return condition, order_by
+
+
+def paginate(
+    conn,
+    select_sql: str,
+    from_clause: str,
+    conditions: Sequence[str],
+    params: Sequence,
+    sort_columns: Sequence[Tuple[str, str]],
+    per_page: int,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+    count: bool = True,
+) -> Page:
+    """Fetch one page of ``SELECT {select_sql} FROM {from_clause} WHERE ...``.
+
+    ``sort_columns`` pairs each ORDER BY expression with the result column
+    holding its value, e.g. ``("b.Title", "Title")``.  The expressions must
+    form a unique key so the seek never skips or repeats rows.
+    """
+    state = decode_cursor(cursor)
+    expressions = [expression for expression, _ in sort_columns]
+    conditions = list(conditions)
+    params = list(params)
+
+    if state and len(state["k"]) == len(sort_columns):
+        forward = state["f"]
+        number = max(state["n"], 1)
+        total = state["t"]
+        condition, order_by = seek_clause(expressions, forward, descending)
+        conditions.append(condition)
+        seek_params = state["k"]
+    else:
+        forward = True
+        number = 1
+        total = None
+        _, order_by = seek_clause(expressions, True, descending)
+        seek_params = []
+        if count:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {from_clause}"
+                + (" WHERE " + " AND ".join(conditions) if conditions else "")
+                + " LIMIT ?)",
+                params + [COUNT_CAP + 1],
+            ).fetchone()[0]
+
+    where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+    rows = conn.execute(
+        f"SELECT {select_sql} FROM {from_clause}{where_clause} ORDER BY {order_by} LIMIT ?",
+        params + seek_params + [per_page + 1],
+    ).fetchall()
+    rows = [dict(row) for row in rows]
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def key_of(row):
+        return [row[column] for _, column in sort_columns]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        has_next = more if forward else True
+        has_prev = (number > 1) if forward else more
+        if has_next:
+            next_cursor = encode_cursor(key_of(rows[-1]), True, number + 1, total)
+        if has_prev:
+            prev_cursor = encode_cursor(key_of(rows[0]), False, number - 1, total)
+    return Page(rows, number, total, next_cursor, prev_cursor)
@@ -0,0 +1,163 @@
+"""Normalize the raw feeds straight into library.db.
+
+Does the work of ``normalize.py`` followed by ``load_data.py`` in one pass:
+normalized frames are inserted as they are produced instead of being written
+to CSV and parsed back.  The normalized CSVs can still be kept for debugging.
+
+    python pipeline.py [--chunksize N] [--workers N] [--write-csv DIR] [--compare]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import load_data
+import normalize
+from db import get_connection
+
+RAW_BOOKS_FILE = Path("books.csv")
+RAW_BORROWERS_FILE = Path("borrowers.csv")
+
+
+# Column-wise equivalents of load_data's _*_rows() helpers, so frames go
+# straight to executemany() without a Python dict per row.
+def _text(column):
+    return column.fillna("").astype(str)
+
+
+def _book_rows(frame):
+    isbn, title = _text(frame["Isbn"]), _text(frame["Title"])
+    keep = (isbn != "") & (title != "")
+    return zip(isbn[keep].str.strip().tolist(), title[keep].str.strip().tolist())
+
+
+def _author_rows(frame):
+    name = _text(frame["Name"])
+    keep = name != ""
+    return zip(frame["Author_id"][keep].astype(int).tolist(), name[keep].str.strip().tolist())
+
+
+def _book_author_rows(frame):
+    isbn = _text(frame["Isbn"])
+    keep = isbn != ""
+    return zip(frame["Author_id"][keep].astype(int).tolist(), isbn[keep].str.strip().tolist())
+
+
+def _borrower_rows(frame):
+    card, ssn = _text(frame["Card_id"]), _text(frame["Ssn"])
+    keep = (card != "") & (ssn != "")
+    frame, card, ssn = frame[keep], card[keep], ssn[keep]
+    digits = card.str.replace(r"\D", "", regex=True)
+    if (digits == "").any():
+        raise ValueError(f"Card_id '{card[digits == ''].iloc[0]}' has no digits")
+    phone = _text(frame["Phone"]).str.strip() if "Phone" in frame else pd.Series("", index=frame.index)
+    return zip(
+        digits.astype(int).tolist(),
+        ssn.str.strip().tolist(),
+        _text(frame["Bname"]).str.strip().tolist(),
+        _text(frame["Address"]).str.strip().tolist(),
+        phone.where(phone != "", None).tolist(),
+    )
+
+
+def _append_csv(frame, path: Path, first: bool) -> None:
+    frame.to_csv(path, mode="w" if first else "a", header=first, index=False)
+
+
+def run_pipeline(conn, chunksize: int = normalize.BOOKS_CHUNKSIZE, workers: int = 1,
+                 csv_dir: Path = None, batch_size: int = load_data.BATCH_SIZE) -> dict:
+    """Drop and reload the database from the raw feeds; returns rows loaded per table.
+
+    With ``csv_dir`` the normalized CSVs are also written there, exactly as
+    normalize.py would write them.
+    """
+    counts = dict.fromkeys(("BOOK", "AUTHORS", "BOOK_AUTHORS", "BORROWER"), 0)
+    paths = None
+    if csv_dir is not None:
+        csv_dir.mkdir(parents=True, exist_ok=True)
+        paths = [csv_dir / path.name for path in (
+            load_data.BOOK_FILE, load_data.AUTHORS_FILE, load_data.BOOK_AUTHORS_FILE, load_data.BORROWER_FILE
+        )]
+
+    with load_data.bulk_load_pragmas(conn):
+        load_data.initialize_schema(conn, with_indexes=False)
+
+        start = time.perf_counter()
+        borrowers = normalize.prepare_borrowers(pd.read_csv(RAW_BORROWERS_FILE, dtype=str))
+        if paths:
+            _append_csv(borrowers, paths[3], True)
+        counts["BORROWER"] = load_data.load_borrowers(conn, batch_size, _borrower_rows(borrowers))
+        load_data.report_load("BORROWER", counts["BORROWER"], time.perf_counter() - start)
+
+        start = time.perf_counter()
+        merger = normalize.BookMerger()
+        first = True
+        for books, links in normalize.prepared_books(RAW_BOOKS_FILE, chunksize, workers):
+            frames = merger.merge(books, links)
+            if paths:
+                for frame, path in zip(frames, paths):
+                    _append_csv(frame, path, first)
+            first = False
+            book_frame, authors, book_authors = frames
+            counts["BOOK"] += load_data.load_book(conn, batch_size, _book_rows(book_frame))
+            counts["AUTHORS"] += load_data.load_authors(conn, batch_size, _author_rows(authors))
+            counts["BOOK_AUTHORS"] += load_data.load_book_authors(conn, batch_size, _book_author_rows(book_authors))
+        elapsed = time.perf_counter() - start
+        for table in ("BOOK", "AUTHORS", "BOOK_AUTHORS"):
+            print(f"  {table:<14} {counts[table]:>10,} rows")
+        print(f"  {'books feed':<14} normalized and loaded in {elapsed:.2f}s")
+
+        load_data.finish_load(conn)
+    return counts
+
+
+def run_two_step(work_dir: Path, chunksize: int, workers: int) -> None:
+    """The normalize.py + load_data.py route, into a scratch database under ``work_dir``."""
+    normalize.normalize_Borrowers(str(RAW_BORROWERS_FILE), str(work_dir / load_data.BORROWER_FILE.name))
+    normalize.normalize_Books(
+        str(RAW_BOOKS_FILE),
+        str(work_dir / load_data.BOOK_FILE.name),
+        chunksize=chunksize,
+        authorsFile=str(work_dir / load_data.AUTHORS_FILE.name),
+        bookAuthorsFile=str(work_dir / load_data.BOOK_AUTHORS_FILE.name),
+        workers=workers,
+    )
+    with get_connection(work_dir / "library.db") as conn:
+        load_data.load_all(conn, source_dir=work_dir)
+    conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Normalize the raw feeds directly into library.db.")
+    parser.add_argument("--chunksize", type=int, default=normalize.BOOKS_CHUNKSIZE,
+                        help=f"rows of books.csv per chunk (default {normalize.BOOKS_CHUNKSIZE})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="prepare books.csv shards in this many processes")
+    parser.add_argument("--write-csv", type=Path, metavar="DIR",
+                        help="also write the normalized CSVs to DIR")
+    parser.add_argument("--compare", action="store_true",
+                        help="also time the two-step normalize.py + load_data.py route and report the difference")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with get_connection() as conn:
+        run_pipeline(conn, args.chunksize, args.workers, args.write_csv)
+    conn.close()
+    pipeline_time = time.perf_counter() - start
+    print(f"Database loaded from raw feeds in {pipeline_time:.2f}s.")
+
+    if args.compare:
+        print("Timing the two-step route for comparison...")
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            run_two_step(Path(tmp), args.chunksize, args.workers)
+            two_step_time = time.perf_counter() - start
+        saved = two_step_time - pipeline_time
+        print(f"two-step: {two_step_time:.2f}s, pipeline: {pipeline_time:.2f}s, "
+              f"saved {saved:.2f}s ({saved / two_step_time:.0%})")
+
+
+if __name__ == "__main__":
+    main()
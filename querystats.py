@@ -0,0 +1,255 @@
+"""Per-statement timing for every query run through db.get_connection.
+
+Connections are opened with InstrumentedConnection, whose cursors time each
+statement from execute through its last fetch and record it under a
+normalized form of its SQL (literals and IN-lists collapsed), together with
+the rows returned or changed and the call site that issued it.  Statements
+slower than the threshold are written to the ``library.slow_queries`` log.
+"""
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+SLOW_QUERY_MS = float(os.environ.get("LIBRARY_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.environ.get("LIBRARY_SLOW_QUERY_LOG")
+
+# Upper bounds, in milliseconds, of the per-statement latency histogram.
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+
+slow_log = logging.getLogger("library.slow_queries")
+if SLOW_QUERY_LOG:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG)
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_log.addHandler(_handler)
+    slow_log.setLevel(logging.WARNING)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+# Per-thread [statements, seconds] totals between start_scope() and end_scope().
+_scope = threading.local()
+
+# Frames from these modules are skipped when looking for the caller.
+_INTERNAL_FILES = {"querystats.py", "db.py", "contextlib.py"}
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace, literals and IN-lists so equivalent queries group together."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?, ...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def _call_site() -> str:
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _INTERNAL_FILES:
+            return f"{filename}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class StatementStats:
+    __slots__ = ("sql", "calls", "total", "max", "rows", "buckets", "sites")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.sites = Counter()
+
+    def as_dict(self) -> dict:
+        return {
+            "sql": self.sql,
+            "calls": self.calls,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.calls if self.calls else 0.0,
+            "max_ms": self.max * 1000,
+            "rows": self.rows,
+            "histogram": dict(zip(LATENCY_BUCKETS_MS, self.buckets)),
+            "sites": self.sites.most_common(),
+        }
+
+
+class QueryStats:
+    """Thread-safe aggregate of statement timings, keyed by normalized SQL."""
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._statements = {}
+
+    def record(self, sql: str, elapsed: float, rows: int, site: str) -> None:
+        key = normalize_sql(sql)
+        elapsed_ms = elapsed * 1000
+        bucket = next(i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats(key)
+            stats.calls += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            stats.rows += rows
+            stats.buckets[bucket] += 1
+            stats.sites[site] += 1
+        totals = getattr(_scope, "totals", None)
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += elapsed
+        if elapsed_ms >= self.slow_ms:
+            slow_log.warning("slow query %.1f ms, %d rows, at %s: %s", elapsed_ms, rows, site, key)
+
+    def top(self, n: int = 10, order_by: str = "total_ms") -> List[dict]:
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._statements.values()]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:n]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
+
+    def report(self, n: int = 10, order_by: str = "total_ms") -> str:
+        lines = [f"{'total ms':>10} {'calls':>8} {'mean ms':>9} {'max ms':>9} {'rows':>10}  statement"]
+        for row in self.top(n, order_by):
+            lines.append(
+                f"{row['total_ms']:>10.1f} {row['calls']:>8,} {row['mean_ms']:>9.2f} "
+                f"{row['max_ms']:>9.2f} {row['rows']:>10,}  {row['sql'][:160]}"
+            )
+            for site, calls in row["sites"][:3]:
+                lines.append(f"{'':>50}  <- {site} ({calls:,})")
+        return "\n".join(lines)
+
+
+STATS = QueryStats()
+
+
+def start_scope() -> None:
+    """Start totalling the statements this thread runs, e.g. for one request."""
+    _scope.totals = [0, 0.0]
+
+
+def end_scope() -> Tuple[int, float]:
+    """Stop totalling and return (statements, seconds) since start_scope()."""
+    totals = getattr(_scope, "totals", None) or [0, 0.0]
+    _scope.totals = None
+    return totals[0], totals[1]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that records each statement with STATS once it is finished.
+
+    A statement finishes when its rows are exhausted, another statement is
+    executed, or the cursor is closed or garbage collected.
+    """
+
+    _pending = None  # [sql, elapsed, rows, site]
+
+    def _finish(self) -> None:
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            STATS.record(*pending)
+
+    def _run(self, sql: str, method, *args):
+        self._finish()
+        site = _call_site()
+        start = time.perf_counter()
+        try:
+            result = method(self, sql, *args)
+        except Exception:
+            STATS.record(sql, time.perf_counter() - start, 0, site)
+            raise
+        self._pending = [sql, time.perf_counter() - start, 0, site]
+        if self.rowcount > 0:
+            self._pending[2] = self.rowcount
+        if self.description is None:
+            self._finish()
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._run(sql, sqlite3.Cursor.execute, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(sql, sqlite3.Cursor.executemany, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._run(sql_script, sqlite3.Cursor.executescript)
+
+    def _fetched(self, start: float, rows: int, exhausted: bool) -> None:
+        if self._pending is not None:
+            self._pending[1] += time.perf_counter() - start
+            self._pending[2] += rows
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = sqlite3.Cursor.fetchone(self)
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = sqlite3.Cursor.fetchmany(self, size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = sqlite3.Cursor.fetchall(self)
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = sqlite3.Cursor.__next__(self)
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        sqlite3.Cursor.close(self)
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            # Module globals may already be gone at interpreter shutdown.
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are all timed by InstrumentedCursor."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
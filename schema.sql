@@ -1,6 +1,8 @@
 CREATE TABLE IF NOT EXISTS BOOK (
     Isbn CHAR(10) PRIMARY KEY,
-    Title VARCHAR(255) NOT NULL
+    Title VARCHAR(255) NOT NULL,
+    Current_loan_id INTEGER,
+    Current_card_id INTEGER
 );
 
 CREATE TABLE IF NOT EXISTS AUTHORS (
@@ -50,4 +52,9 @@ CREATE TABLE IF NOT EXISTS USERS (
     Role VARCHAR(20) DEFAULT 'librarian' CHECK (Role IN ('librarian', 'borrower', 'superuser')),
     Created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (Card_id) REFERENCES BORROWER(Card_id)
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS APP_STATE (
+    Name VARCHAR(50) PRIMARY KEY,
+    Value VARCHAR(255) NOT NULL
+);
@@ -1,22 +1,206 @@
-from typing import List
-
-SEARCH_BASE = """
-SELECT
-    b.Isbn,
-    b.Title,
-    COALESCE(GROUP_CONCAT(a.Name, ', '), '') AS Authors,
-    CASE
-        WHEN EXISTS (
-            SELECT 1 FROM BOOK_LOANS bl WHERE bl.Isbn = b.Isbn AND bl.Date_in IS NULL
-        ) THEN 'OUT'
-        ELSE 'IN'
-    END AS Status
-FROM BOOK b
-LEFT JOIN BOOK_AUTHORS ba ON b.Isbn = ba.Isbn
-LEFT JOIN AUTHORS a ON ba.Author_id = a.Author_id
+from typing import List, Optional, Tuple
+
+import pagination
+
+# The trigram tokenizer cannot index patterns shorter than three characters,
+# so shorter queries fall back to a substring scan over BOOK_SEARCH.
+MIN_TRIGRAM_LENGTH = 3
+
+SEARCH_PAGE_SIZE = 50
+
+# Authors joined per book, in the same shape the search pages display.
+BOOK_AUTHORS_EXPR = """
+COALESCE((
+    SELECT GROUP_CONCAT(a.Name, ', ')
+    FROM BOOK_AUTHORS ba
+    JOIN AUTHORS a ON ba.Author_id = a.Author_id
+    WHERE ba.Isbn = {isbn}
+), '')
+"""
+
+# One row per book with everything a search result displays, so queries read
+# the author string instead of aggregating BOOK_AUTHORS per row.  Search_text
+# is the lowercased ISBN, title and authors (unit-separated) for short
+# substring queries.  Rows are matched to BOOK by Isbn; Book_rowid is only
+# BOOK_FTS's content rowid, since BOOK's own rowids may be renumbered by VACUUM.
+SEARCH_TABLES = """
+CREATE TABLE IF NOT EXISTS BOOK_SEARCH (
+    Book_rowid INTEGER PRIMARY KEY,
+    Isbn CHAR(10) NOT NULL UNIQUE,
+    Title VARCHAR(255) NOT NULL,
+    Authors_display TEXT NOT NULL,
+    Search_text TEXT GENERATED ALWAYS AS (
+        lower(Isbn || char(31) || Title || char(31) || Authors_display)
+    ) STORED
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS BOOK_FTS USING fts5(
+    Isbn,
+    Title,
+    Authors_display,
+    content = 'BOOK_SEARCH',
+    content_rowid = 'Book_rowid',
+    tokenize = 'trigram'
+);
+"""
+
+# Title order for browsing and short-query scans, so a page stops after
+# per_page matches instead of sorting every match.
+SEARCH_INDEXES = """
+CREATE INDEX IF NOT EXISTS IDX_BOOK_SEARCH_TITLE ON BOOK_SEARCH(Title, Isbn);
+"""
+
+# Catalogue changes update BOOK_SEARCH; BOOK_SEARCH changes update BOOK_FTS,
+# which indexes BOOK_SEARCH's text without storing a second copy of it.
+SEARCH_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS BOOK_SEARCH_BOOK_AI AFTER INSERT ON BOOK BEGIN
+    INSERT INTO BOOK_SEARCH(Isbn, Title, Authors_display)
+    VALUES (NEW.Isbn, NEW.Title, {new_authors});
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_SEARCH_BOOK_AU AFTER UPDATE OF Isbn, Title ON BOOK BEGIN
+    UPDATE BOOK_SEARCH
+    SET Isbn = NEW.Isbn, Title = NEW.Title, Authors_display = {new_authors}
+    WHERE Isbn = OLD.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_SEARCH_BOOK_AD AFTER DELETE ON BOOK BEGIN
+    DELETE FROM BOOK_SEARCH WHERE Isbn = OLD.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_SEARCH_BOOK_AUTHORS_AI AFTER INSERT ON BOOK_AUTHORS BEGIN
+    UPDATE BOOK_SEARCH SET Authors_display = {new_authors} WHERE Isbn = NEW.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_SEARCH_BOOK_AUTHORS_AU AFTER UPDATE ON BOOK_AUTHORS BEGIN
+    UPDATE BOOK_SEARCH SET Authors_display = {old_authors} WHERE Isbn = OLD.Isbn;
+    UPDATE BOOK_SEARCH SET Authors_display = {new_authors} WHERE Isbn = NEW.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_SEARCH_BOOK_AUTHORS_AD AFTER DELETE ON BOOK_AUTHORS BEGIN
+    UPDATE BOOK_SEARCH SET Authors_display = {old_authors} WHERE Isbn = OLD.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_SEARCH_AUTHORS_AU AFTER UPDATE OF Name ON AUTHORS BEGIN
+    UPDATE BOOK_SEARCH SET Authors_display = {row_authors}
+    WHERE Isbn IN (SELECT Isbn FROM BOOK_AUTHORS WHERE Author_id = NEW.Author_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_SEARCH_AUTHORS_AD AFTER DELETE ON AUTHORS BEGIN
+    UPDATE BOOK_SEARCH SET Authors_display = {row_authors}
+    WHERE Isbn IN (SELECT Isbn FROM BOOK_AUTHORS WHERE Author_id = OLD.Author_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_FTS_SEARCH_AI AFTER INSERT ON BOOK_SEARCH BEGIN
+    INSERT INTO BOOK_FTS(rowid, Isbn, Title, Authors_display)
+    VALUES (NEW.Book_rowid, NEW.Isbn, NEW.Title, NEW.Authors_display);
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_FTS_SEARCH_AU AFTER UPDATE ON BOOK_SEARCH
+WHEN OLD.Book_rowid IS NOT NEW.Book_rowid OR OLD.Isbn IS NOT NEW.Isbn
+  OR OLD.Title IS NOT NEW.Title OR OLD.Authors_display IS NOT NEW.Authors_display BEGIN
+    INSERT INTO BOOK_FTS(BOOK_FTS, rowid, Isbn, Title, Authors_display)
+    VALUES ('delete', OLD.Book_rowid, OLD.Isbn, OLD.Title, OLD.Authors_display);
+    INSERT INTO BOOK_FTS(rowid, Isbn, Title, Authors_display)
+    VALUES (NEW.Book_rowid, NEW.Isbn, NEW.Title, NEW.Authors_display);
+END;
+
+CREATE TRIGGER IF NOT EXISTS BOOK_FTS_SEARCH_AD AFTER DELETE ON BOOK_SEARCH BEGIN
+    INSERT INTO BOOK_FTS(BOOK_FTS, rowid, Isbn, Title, Authors_display)
+    VALUES ('delete', OLD.Book_rowid, OLD.Isbn, OLD.Title, OLD.Authors_display);
+END;
+""".format(
+    new_authors=BOOK_AUTHORS_EXPR.format(isbn="NEW.Isbn"),
+    old_authors=BOOK_AUTHORS_EXPR.format(isbn="OLD.Isbn"),
+    row_authors=BOOK_AUTHORS_EXPR.format(isbn="BOOK_SEARCH.Isbn"),
+)
+
+# Result columns shared by every search query.
+SEARCH_COLUMNS = """
+    s.Isbn,
+    s.Title,
+    s.Authors_display AS Authors,
+    CASE WHEN b.Current_loan_id IS NULL THEN 'IN' ELSE 'OUT' END AS Status
 """
 
-TAIL = " GROUP BY b.Isbn, b.Title ORDER BY b.Title"
+SEARCH_FROM = "BOOK_SEARCH s JOIN BOOK b ON b.Isbn = s.Isbn"
+FTS_FROM = "BOOK_FTS JOIN BOOK_SEARCH s ON s.Book_rowid = BOOK_FTS.rowid JOIN BOOK b ON b.Isbn = s.Isbn"
+
+
+def _search_triggers(conn) -> List[str]:
+    # Includes the BOOK_FTS_* triggers of databases from before BOOK_SEARCH.
+    return [
+        row[0] for row in conn.execute(
+            """
+            SELECT name FROM sqlite_master
+            WHERE type = 'trigger' AND (name GLOB 'BOOK_FTS_*' OR name GLOB 'BOOK_SEARCH_*')
+            """
+        )
+    ]
+
+
+def rebuild_search_index(conn) -> None:
+    """(Re)build BOOK_SEARCH and BOOK_FTS from the catalogue tables and install their triggers."""
+    for name in _search_triggers(conn):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS BOOK_FTS")
+    conn.execute("DROP TABLE IF EXISTS BOOK_SEARCH")
+    conn.executescript(SEARCH_TABLES)
+    conn.execute(
+        """
+        INSERT INTO BOOK_SEARCH(Book_rowid, Isbn, Title, Authors_display)
+        SELECT b.rowid, b.Isbn, b.Title, COALESCE(GROUP_CONCAT(a.Name, ', '), '')
+        FROM BOOK b
+        LEFT JOIN BOOK_AUTHORS ba ON b.Isbn = ba.Isbn
+        LEFT JOIN AUTHORS a ON ba.Author_id = a.Author_id
+        GROUP BY b.rowid
+        """
+    )
+    conn.execute("INSERT INTO BOOK_FTS(BOOK_FTS) VALUES ('rebuild')")
+    conn.executescript(SEARCH_INDEXES)
+    conn.execute("ANALYZE BOOK_SEARCH")
+    conn.executescript(SEARCH_TRIGGERS)
+    conn.commit()
+
+
+def ensure_search_index(conn) -> None:
+    """Build BOOK_SEARCH and BOOK_FTS for databases created before they existed.
+
+    Existing tables keep their rows; missing indexes are added and the
+    triggers reinstalled, so databases pick up changes without a rebuild.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'BOOK_SEARCH'"
+    ).fetchone()
+    if not exists:
+        rebuild_search_index(conn)
+        return
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'IDX_BOOK_SEARCH_TITLE'"
+    ).fetchone():
+        conn.executescript(SEARCH_INDEXES)
+        conn.execute("ANALYZE BOOK_SEARCH")
+    for name in _search_triggers(conn):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.executescript(SEARCH_TRIGGERS)
+    conn.commit()
+
+
+def fts_phrase(query: str) -> str:
+    """Quote free text as a single FTS5 phrase (a substring match under trigram)."""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def match_condition(query: str) -> Tuple[str, str, list, bool]:
+    """Return (from_clause, condition, params, ranked) restricting results to ``query``.
+
+    ``ranked`` is True when the condition is a MATCH, so ``bm25(BOOK_FTS)``
+    can be used to order the results.  Both from-clauses expose BOOK as ``b``
+    and BOOK_SEARCH as ``s``.
+    """
+    if len(query) >= MIN_TRIGRAM_LENGTH:
+        return FTS_FROM, "BOOK_FTS MATCH ?", [fts_phrase(query)], True
+    return SEARCH_FROM, "instr(s.Search_text, lower(?)) > 0", [query], False
 
 
 def search_books(conn, query: str) -> List[dict]:
@@ -26,15 +210,59 @@ def search_books(conn, query: str) -> List[dict]:
 
     cursor = conn.cursor()
     if len(query) == 10 and query.isalnum():
-        sql = SEARCH_BASE + " WHERE b.Isbn = ?" + TAIL
+        sql = f"SELECT {SEARCH_COLUMNS} FROM {SEARCH_FROM} WHERE s.Isbn = ? ORDER BY s.Title"
         cursor.execute(sql, (query,))
     else:
-        term = f"%{query.lower()}%"
-        sql = (
-            SEARCH_BASE
-            + " WHERE LOWER(b.Isbn) LIKE ? OR LOWER(b.Title) LIKE ? OR LOWER(a.Name) LIKE ?"
-            + TAIL
-        )
-        cursor.execute(sql, (term, term, term))
+        from_clause, condition, params, ranked = match_condition(query)
+        order_by = "bm25(BOOK_FTS), s.Title" if ranked else "s.Title"
+        sql = f"SELECT {SEARCH_COLUMNS} FROM {from_clause} WHERE {condition} ORDER BY {order_by}"
+        cursor.execute(sql, params)
 
     return [dict(row) for row in cursor.fetchall()]
+
+
+def search_page(conn, query: str, status: str = "all", cursor: Optional[str] = None,
+                per_page: int = SEARCH_PAGE_SIZE) -> Tuple[pagination.Page, str]:
+    """One page of the /search catalogue listing.
+
+    ``status`` is ``all``, ``available`` or ``checked_out``.  Returns the page
+    and how it was answered: ``fts``, ``like`` or ``browse`` (no query).
+    """
+    where_conditions = []
+    params = []
+    from_clause = SEARCH_FROM
+    # Keyset order: (Title, Isbn), preceded by the bm25 rank when searching
+    sort_columns = [("s.Title", "Title"), ("s.Isbn", "Isbn")]
+    rank_column = ""
+    mode = "browse"
+
+    if query:
+        # Search ISBN, Title, and Author through the full-text index
+        from_clause, condition, match_params, ranked = match_condition(query)
+        where_conditions.append(condition)
+        params.extend(match_params)
+        mode = "fts" if ranked else "like"
+        if ranked:
+            sort_columns.insert(0, ("bm25(BOOK_FTS)", "Rank"))
+            rank_column = "bm25(BOOK_FTS) AS Rank,"
+
+    if status == "available":
+        where_conditions.append("b.Current_loan_id IS NULL")
+    elif status == "checked_out":
+        where_conditions.append("b.Current_loan_id IS NOT NULL")
+
+    # One page of results with Borrower ID, seeking past the cursor.
+    # Availability comes from BOOK's trigger-maintained current-loan columns.
+    select_sql = f"""
+            s.Isbn,
+            s.Title,
+            s.Authors_display AS Authors,
+            {rank_column}
+            CASE WHEN b.Current_loan_id IS NULL THEN 'IN' ELSE 'OUT' END AS Status,
+            b.Current_card_id AS Borrower_ID
+    """
+    page = pagination.paginate(
+        conn, select_sql, from_clause, where_conditions, params,
+        sort_columns, per_page, cursor=cursor,
+    )
+    return page, mode
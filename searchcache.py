@@ -0,0 +1,182 @@
+"""LRU cache of catalogue search results, in front of search.py.
+
+Popular searches are answered from memory instead of re-running the count
+and page queries.  Entries are keyed on the exact arguments of the search
+call and capped both in number and in (estimated) bytes.
+
+Invalidation follows what changed:
+
+* catalogue edits and imports advance the CATALOG_CHANGES feed (see
+  suggest.py); the cache compares the feed position on every lookup and
+  empties itself when it moves;
+* checkouts and check-ins made through loans.py replace cached rows for
+  that ISBN with copies carrying the new Status and Borrower_ID, and drop
+  the entries filtered by availability, whose membership may have changed;
+* circulation written by other processes is picked up when entries
+  expire, after ``LIBRARY_SEARCH_CACHE_TTL`` seconds.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import metrics
+import pagination
+import search
+from suggest import feed_position
+
+MAX_ENTRIES = int(os.environ.get("LIBRARY_SEARCH_CACHE_SIZE", "1024"))
+MAX_BYTES = int(os.environ.get("LIBRARY_SEARCH_CACHE_BYTES", str(32 * 1024 * 1024)))
+TTL_SECONDS = float(os.environ.get("LIBRARY_SEARCH_CACHE_TTL", "30"))
+# Rough per-row overhead of a result dict on top of its strings.
+ROW_OVERHEAD = 250
+
+
+class _Entry:
+    __slots__ = ("value", "rows", "filtered", "size", "expires")
+
+    def __init__(self, value, rows: List[dict], filtered: bool, size: int, expires: float):
+        self.value = value
+        self.rows = rows
+        self.filtered = filtered
+        self.size = size
+        self.expires = expires
+
+
+class SearchCache:
+    """Size- and memory-bounded LRU of search results with per-ISBN invalidation."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES,
+                 ttl: float = TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._by_isbn: Dict[str, set] = {}
+        self._bytes = 0
+        self._position = None
+        self._epoch = 0  # bumped by every checkout and check-in
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, conn, key: Hashable) -> Tuple[Optional[object], Tuple]:
+        """Return (cached value or None, a token to pass to ``put`` on a miss)."""
+        position = _catalogue_position(conn)
+        with self._lock:
+            if position != self._position:
+                self._clear()
+                self._position = position
+            token = (position, self._epoch)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                metrics.SEARCH_CACHE.inc(result="miss")
+                return None, token
+            self._entries.move_to_end(key)
+        metrics.SEARCH_CACHE.inc(result="hit")
+        return entry.value, token
+
+    def put(self, key: Hashable, value, rows: List[dict], filtered: bool, token: Tuple) -> None:
+        """Cache ``value`` (whose result rows are ``rows``) unless anything changed since ``get``."""
+        size = sum(ROW_OVERHEAD + sum(len(v) for v in row.values() if isinstance(v, str)) for row in rows)
+        if size > self.max_bytes // 4:
+            return  # one huge result would push out everything else
+        with self._lock:
+            if token != (self._position, self._epoch):
+                return  # the result may predate a catalogue or circulation change
+            self._discard(key)
+            self._entries[key] = _Entry(value, rows, filtered, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            for row in rows:
+                self._by_isbn.setdefault(row["Isbn"], set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+                metrics.SEARCH_CACHE_EVICTIONS.inc()
+
+    def book_status(self, isbn: str, card_id: Optional[int]) -> None:
+        """Record a checkout (``card_id`` set) or check-in (``card_id`` None) of ``isbn``."""
+        status = "IN" if card_id is None else "OUT"
+        with self._lock:
+            self._epoch += 1
+            # A listing filtered by availability may gain or lose this book.
+            for key in [key for key, entry in self._entries.items() if entry.filtered]:
+                self._discard(key)
+            # Swap in patched copies; callers may still be reading the old dicts.
+            for key in self._by_isbn.get(isbn, ()):
+                rows = self._entries[key].rows
+                for i, row in enumerate(rows):
+                    if row["Isbn"] == isbn:
+                        patched = dict(row, Status=status)
+                        if "Borrower_ID" in row:
+                            patched["Borrower_ID"] = card_id
+                        rows[i] = patched
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._by_isbn.clear()
+        self._bytes = 0
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        for row in entry.rows:
+            keys = self._by_isbn.get(row["Isbn"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_isbn[row["Isbn"]]
+
+
+def _catalogue_position(conn):
+    try:
+        return feed_position(conn)
+    except sqlite3.OperationalError:
+        return None  # no change feed (e.g. mid-reload); rely on the TTL
+
+
+CACHE = SearchCache()
+metrics.REGISTRY.register(metrics.Gauge(
+    "library_search_cache_size", "Cached search results and their estimated size.", ("unit",),
+    function=lambda: {("entries",): len(CACHE), ("bytes",): CACHE.size_bytes},
+))
+
+
+def search_page(conn, query: str, status: str = "all", cursor: Optional[str] = None,
+                per_page: int = search.SEARCH_PAGE_SIZE) -> Tuple[pagination.Page, str]:
+    """Cached :func:`search.search_page`; the returned rows are never modified later."""
+    key = ("page", query, status, cursor, per_page)
+    cached, token = CACHE.get(conn, key)
+    if cached is None:
+        cached = search.search_page(conn, query, status, cursor, per_page)
+        CACHE.put(key, cached, cached[0].rows, status != "all", token)
+    page, mode = cached
+    # A fresh Page and row list, so later patches to the cached entry never
+    # change what this caller is reading.
+    return pagination.Page(list(page.rows), page.number, page.total,
+                           page.next_cursor, page.prev_cursor), mode
+
+
+def search_books(conn, query: str) -> List[dict]:
+    """Cached :func:`search.search_books`; the returned rows are never modified later."""
+    key = ("books", query)
+    cached, token = CACHE.get(conn, key)
+    if cached is None:
+        cached = search.search_books(conn, query)
+        CACHE.put(key, cached, cached, False, token)
+    return list(cached)
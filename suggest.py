@@ -0,0 +1,326 @@
+"""In-memory prefix index behind the search box's typeahead (/api/suggest).
+
+Book titles, ISBNs and author names are held lowercased in one sorted list,
+so a prefix lookup is a bisect plus a short forward scan.  A parallel
+``array`` packs each entry's kind and id into one integer, and book titles
+and ISBNs live in lists indexed by BOOK's rowid, so the index costs little
+more than the strings themselves.
+
+The index is built from SQLite at startup and follows the CATALOG_CHANGES
+feed, which triggers on BOOK, BOOK_AUTHORS and AUTHORS append to.  Each process keeps its
+own position in the feed; a full reload starts a new feed generation, which
+makes every process rebuild.
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+# How often, at most, a request checks CATALOG_CHANGES for new entries.
+REFRESH_SECONDS = float(os.environ.get("LIBRARY_SUGGEST_REFRESH_SECONDS", "1"))
+# Past this many pending changes a rebuild is cheaper than applying them one by one.
+REBUILD_THRESHOLD = 2000
+# Feed entries kept by prune_change_feed(); a process further behind rebuilds.
+FEED_KEEP = 100_000
+# Duplicate titles (editions) are skipped, but only this many entries per
+# requested suggestion are examined.
+SCAN_FACTOR = 20
+
+# Entry kinds, in the low two bits of each packed ref.
+TITLE, ISBN, AUTHOR = 0, 1, 2
+KIND_NAMES = ("title", "isbn", "author")
+
+CHANGE_FEED = """
+CREATE TABLE IF NOT EXISTS CATALOG_CHANGES (
+    Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    Kind VARCHAR(10) NOT NULL CHECK (Kind IN ('book', 'author', 'reset')),
+    Ref_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_BOOK_AI AFTER INSERT ON BOOK BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) VALUES ('book', NEW.rowid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_BOOK_AU AFTER UPDATE OF Isbn, Title ON BOOK BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) VALUES ('book', NEW.rowid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_BOOK_AD AFTER DELETE ON BOOK BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) VALUES ('book', OLD.rowid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_BOOK_AUTHORS_AI AFTER INSERT ON BOOK_AUTHORS BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) SELECT 'book', rowid FROM BOOK WHERE Isbn = NEW.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_BOOK_AUTHORS_AU AFTER UPDATE ON BOOK_AUTHORS BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) SELECT 'book', rowid FROM BOOK WHERE Isbn IN (OLD.Isbn, NEW.Isbn);
+END;
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_BOOK_AUTHORS_AD AFTER DELETE ON BOOK_AUTHORS BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) SELECT 'book', rowid FROM BOOK WHERE Isbn = OLD.Isbn;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_AUTHORS_AI AFTER INSERT ON AUTHORS BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) VALUES ('author', NEW.Author_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_AUTHORS_AU AFTER UPDATE OF Author_id, Name ON AUTHORS BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) VALUES ('author', OLD.Author_id);
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id)
+    SELECT 'author', NEW.Author_id WHERE NEW.Author_id IS NOT OLD.Author_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CATALOG_CHANGES_AUTHORS_AD AFTER DELETE ON AUTHORS BEGIN
+    INSERT INTO CATALOG_CHANGES(Kind, Ref_id) VALUES ('author', OLD.Author_id);
+END;
+"""
+
+CHANGE_FEED_TRIGGER_NAMES = (
+    "CATALOG_CHANGES_BOOK_AI",
+    "CATALOG_CHANGES_BOOK_AU",
+    "CATALOG_CHANGES_BOOK_AD",
+    "CATALOG_CHANGES_BOOK_AUTHORS_AI",
+    "CATALOG_CHANGES_BOOK_AUTHORS_AU",
+    "CATALOG_CHANGES_BOOK_AUTHORS_AD",
+    "CATALOG_CHANGES_AUTHORS_AI",
+    "CATALOG_CHANGES_AUTHORS_AU",
+    "CATALOG_CHANGES_AUTHORS_AD",
+)
+
+
+def rebuild_change_feed(conn) -> None:
+    """Start a new feed generation: an empty CATALOG_CHANGES and fresh triggers.
+
+    Row 0 holds the generation token; indexes built from an older generation
+    see it change and rebuild.
+    """
+    for name in CHANGE_FEED_TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS CATALOG_CHANGES")
+    conn.executescript(CHANGE_FEED)
+    conn.execute(
+        "INSERT INTO CATALOG_CHANGES(Seq, Kind, Ref_id) VALUES (0, 'reset', ?)",
+        (random.getrandbits(62),),
+    )
+    conn.commit()
+
+
+def ensure_change_feed(conn) -> None:
+    """Install the feed on databases that predate it, add missing triggers and trim old entries."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'CATALOG_CHANGES'"
+    ).fetchone()
+    if not exists:
+        rebuild_change_feed(conn)
+        return
+    conn.executescript(CHANGE_FEED)
+    prune_change_feed(conn)
+
+
+def feed_position(conn) -> Tuple[Optional[int], int]:
+    """Return (generation token, last Seq) of CATALOG_CHANGES."""
+    generation, seq = conn.execute(
+        "SELECT (SELECT Ref_id FROM CATALOG_CHANGES WHERE Seq = 0), MAX(Seq) FROM CATALOG_CHANGES"
+    ).fetchone()
+    return generation, seq or 0
+
+
+def prune_change_feed(conn, keep: int = FEED_KEEP) -> None:
+    conn.execute(
+        "DELETE FROM CATALOG_CHANGES WHERE Seq > 0 AND Seq <= (SELECT MAX(Seq) FROM CATALOG_CHANGES) - ?",
+        (keep,),
+    )
+    conn.commit()
+
+
+class SuggestIndex:
+    """Sorted prefix index over book titles, ISBNs and author names."""
+
+    __slots__ = ("keys", "refs", "titles", "isbns", "authors",
+                 "generation", "seq", "checked_at", "_lock", "_refreshing")
+
+    def __init__(self):
+        self.keys: List[str] = []   # lowercased text, sorted by (key, ref)
+        self.refs = array("q")      # id << 2 | kind, parallel to keys
+        self.titles: List[Optional[str]] = []   # by BOOK rowid
+        self.isbns: List[Optional[str]] = []    # by BOOK rowid
+        self.authors = {}                       # Author_id -> Name
+        self.generation = None
+        self.seq = 0
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def build(self, conn) -> None:
+        """Load every title, ISBN and author name and catch up with the feed."""
+        generation, seq = feed_position(conn)
+        titles, isbns, authors, entries = [], [], {}, []
+        for rowid, isbn, title in conn.execute("SELECT rowid, Isbn, Title FROM BOOK"):
+            if rowid >= len(titles):
+                grow = rowid + 1 - len(titles)
+                titles.extend([None] * grow)
+                isbns.extend([None] * grow)
+            titles[rowid] = sys.intern(title)
+            isbns[rowid] = isbn
+            entries.append((sys.intern(title.lower()), rowid << 2 | TITLE))
+            entries.append((_lowered(isbn), rowid << 2 | ISBN))
+        for author_id, name in conn.execute("SELECT Author_id, Name FROM AUTHORS"):
+            authors[author_id] = sys.intern(name)
+            entries.append((sys.intern(name.lower()), author_id << 2 | AUTHOR))
+        entries.sort()
+        keys = [key for key, _ in entries]
+        refs = array("q", (ref for _, ref in entries))
+        del entries
+
+        with self._lock:
+            self.keys, self.refs = keys, refs
+            self.titles, self.isbns, self.authors = titles, isbns, authors
+            self.generation, self.seq = generation, seq
+            self.checked_at = time.monotonic()
+
+    def due(self) -> bool:
+        """True when REFRESH_SECONDS have passed since the feed was last checked."""
+        return time.monotonic() - self.checked_at >= REFRESH_SECONDS
+
+    def refresh(self, conn) -> None:
+        """Apply CATALOG_CHANGES entries added since the last build or refresh."""
+        if not self._refreshing.acquire(blocking=False):
+            return  # another thread is already catching up
+        try:
+            self._refresh(conn)
+        except sqlite3.OperationalError:
+            pass  # feed dropped mid-reload; keep serving the old index until it is back
+        finally:
+            self._refreshing.release()
+
+    def _refresh(self, conn) -> None:
+        self.checked_at = time.monotonic()
+        rows = conn.execute(
+            "SELECT Seq, Kind, Ref_id FROM CATALOG_CHANGES WHERE Seq = 0 OR Seq > ? ORDER BY Seq",
+            (self.seq,),
+        ).fetchall()
+        changes = rows[1:]
+        if (
+            not rows
+            or rows[0][0] != 0
+            or rows[0][2] != self.generation
+            or len(changes) > REBUILD_THRESHOLD
+            or (changes and changes[0][0] != self.seq + 1)  # pruned past our position
+        ):
+            self.build(conn)
+            return
+        if not changes:
+            return
+
+        book_ids = json.dumps(sorted({ref for _, kind, ref in changes if kind == "book"}))
+        author_ids = json.dumps(sorted({ref for _, kind, ref in changes if kind == "author"}))
+        books = {
+            rowid: (isbn, title) for rowid, isbn, title in conn.execute(
+                "SELECT rowid, Isbn, Title FROM BOOK WHERE rowid IN (SELECT value FROM json_each(?))",
+                (book_ids,),
+            )
+        }
+        authors = dict(conn.execute(
+            "SELECT Author_id, Name FROM AUTHORS WHERE Author_id IN (SELECT value FROM json_each(?))",
+            (author_ids,),
+        ).fetchall())
+
+        with self._lock:
+            for rowid in json.loads(book_ids):
+                self._set_book(rowid, *books.get(rowid, (None, None)))
+            for author_id in json.loads(author_ids):
+                self._set_author(author_id, authors.get(author_id))
+            self.seq = changes[-1][0]
+
+    def _set_book(self, rowid: int, isbn: Optional[str], title: Optional[str]) -> None:
+        if rowid < len(self.titles) and self.titles[rowid] is not None:
+            self._remove(self.titles[rowid].lower(), rowid << 2 | TITLE)
+            self._remove(self.isbns[rowid].lower(), rowid << 2 | ISBN)
+            self.titles[rowid] = self.isbns[rowid] = None
+        if title is None:
+            return
+        if rowid >= len(self.titles):
+            grow = rowid + 1 - len(self.titles)
+            self.titles.extend([None] * grow)
+            self.isbns.extend([None] * grow)
+        self.titles[rowid] = sys.intern(title)
+        self.isbns[rowid] = isbn
+        self._insert(sys.intern(title.lower()), rowid << 2 | TITLE)
+        self._insert(_lowered(isbn), rowid << 2 | ISBN)
+
+    def _set_author(self, author_id: int, name: Optional[str]) -> None:
+        old = self.authors.pop(author_id, None)
+        if old is not None:
+            self._remove(old.lower(), author_id << 2 | AUTHOR)
+        if name is not None:
+            self.authors[author_id] = sys.intern(name)
+            self._insert(sys.intern(name.lower()), author_id << 2 | AUTHOR)
+
+    def _insert(self, key: str, ref: int) -> None:
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key and self.refs[i] < ref:
+            i += 1
+        self.keys.insert(i, key)
+        self.refs.insert(i, ref)
+
+    def _remove(self, key: str, ref: int) -> None:
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.refs[i] == ref:
+                del self.keys[i]
+                del self.refs[i]
+                return
+            i += 1
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> List[dict]:
+        """Up to ``limit`` distinct titles, ISBNs and author names starting with ``prefix``."""
+        prefix = (prefix or "").strip().lower()
+        if not prefix or limit <= 0:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            keys, refs = self.keys, self.refs
+            i = bisect_left(keys, prefix)
+            end = min(len(keys), i + limit * SCAN_FACTOR)
+            while i < end and len(results) < limit:
+                key = keys[i]
+                if not key.startswith(prefix):
+                    break
+                ref = refs[i]
+                i += 1
+                kind, ident = ref & 3, ref >> 2
+                if (kind, key) in seen:
+                    continue
+                seen.add((kind, key))
+                if kind == AUTHOR:
+                    results.append({"type": "author", "text": self.authors[ident], "author_id": ident})
+                else:
+                    results.append({
+                        "type": KIND_NAMES[kind],
+                        "text": self.titles[ident] if kind == TITLE else self.isbns[ident],
+                        "isbn": self.isbns[ident],
+                        "title": self.titles[ident],
+                    })
+        return results
+
+
+def _lowered(text: str) -> str:
+    # ISBNs are mostly digits already; keep one string object when nothing changes.
+    lowered = text.lower()
+    return text if lowered == text else lowered
+
+
+INDEX = SuggestIndex()
@@ -0,0 +1,192 @@
+"""Generate a production-scale library database with realistic skew.
+
+Titles are borrowed with Zipf-like popularity, a few prolific authors write
+most books, borrowers vary in how often they borrow, and return times follow
+a long-tailed overdue distribution.  Fines are computed by the real
+refresh_fines() and most older ones are marked paid.
+
+    python synthetic.py --db scaled.db --books 2000000 --borrowers 100000 --loans 5000000
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+import fines
+import load_data
+from db import get_connection
+
+WORDS = (
+    "shadow river garden winter silent empire night city secret history last light "
+    "house ocean dream stone fire king queen world war love journey star memory island "
+    "road storm glass iron forest moon summer letters daughter children mountain wind "
+    "song lost hidden golden broken wild dark little great second return quiet"
+).split()
+FIRST_NAMES = (
+    "James Mary Robert Patricia John Jennifer Michael Linda David Elizabeth William Barbara "
+    "Richard Susan Joseph Jessica Thomas Sarah Charles Karen Wei Priya Ahmed Sofia Kenji Amara"
+).split()
+LAST_NAMES = (
+    "Smith Johnson Williams Brown Jones Garcia Miller Davis Rodriguez Martinez Hernandez Lopez "
+    "Wilson Anderson Taylor Moore Jackson Martin Lee Nguyen Okafor Tanaka Rossi Kowalski Haddad"
+).split()
+CITIES = (("Dallas", "TX"), ("Plano", "TX"), ("Richardson", "TX"), ("Austin", "TX"),
+          ("Tulsa", "OK"), ("Denver", "CO"), ("Phoenix", "AZ"), ("Chicago", "IL"))
+
+LOAN_DAYS = 14
+MAX_ACTIVE_LOANS = 3
+
+
+def zipf_weights(n: int, s: float):
+    """Cumulative weights for rank ``i`` proportional to 1 / (i + 1) ** s."""
+    return list(accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def _book_rows(rng: random.Random, books: int):
+    for i in range(books):
+        words = rng.sample(WORDS, rng.randint(2, 5))
+        yield f"{i:010d}", " ".join(words).title()
+
+
+def _author_rows(rng: random.Random, authors: int):
+    for author_id in range(1, authors + 1):
+        yield author_id, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {author_id}"
+
+
+def _book_author_rows(rng: random.Random, books: int, authors: int):
+    # Prolific authors: author popularity is Zipf-distributed over ids.
+    cumulative = zipf_weights(authors, 0.9)
+    population = range(1, authors + 1)
+    for i in range(books):
+        for author_id in set(rng.choices(population, cum_weights=cumulative, k=rng.choice((1, 1, 1, 2, 3)))):
+            yield author_id, f"{i:010d}"
+
+
+def _borrower_rows(rng: random.Random, borrowers: int):
+    for card_id in range(1, borrowers + 1):
+        city, state = rng.choice(CITIES)
+        yield (
+            card_id,
+            f"{card_id // 10000:03d}-{card_id // 100 % 100:02d}-{card_id % 10000:04d}",
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            f"{rng.randint(1, 9999)} {rng.choice(WORDS).title()} Street, {city}, {state}",
+            f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+        )
+
+
+def _return_delay(rng: random.Random) -> int:
+    """Days from checkout to return: mostly on time, with a long overdue tail."""
+    roll = rng.random()
+    if roll < 0.70:
+        return rng.randint(1, LOAN_DAYS)
+    if roll < 0.95:
+        return LOAN_DAYS + 1 + int(rng.expovariate(1 / 7))
+    return LOAN_DAYS + 30 + int(rng.expovariate(1 / 60))
+
+
+def _loan_rows(rng: random.Random, loans: int, books: int, borrowers: int, years: int, today: date):
+    """Loans in Date_out order; at most one open loan per book and three per borrower."""
+    book_weights = zipf_weights(books, 1.0)
+    borrower_weights = zipf_weights(borrowers, 0.6)
+    book_ids = range(books)
+    card_ids = range(1, borrowers + 1)
+    days = years * 365
+    start = today - timedelta(days=days)
+    open_books = set()
+    open_per_card = {}
+    loan_id = 0
+    for day in range(days + 1):
+        date_out = start + timedelta(days=day)
+        remaining_days = days + 1 - day
+        count = (loans - loan_id) // remaining_days
+        if rng.random() < ((loans - loan_id) % remaining_days) / remaining_days:
+            count += 1
+        picked_books = rng.choices(book_ids, cum_weights=book_weights, k=count)
+        picked_cards = rng.choices(card_ids, cum_weights=borrower_weights, k=count)
+        for book, card_id in zip(picked_books, picked_cards):
+            isbn = f"{book:010d}"
+            date_in = date_out + timedelta(days=_return_delay(rng))
+            if date_in > today:
+                if isbn in open_books or open_per_card.get(card_id, 0) >= MAX_ACTIVE_LOANS:
+                    date_in = today
+                else:
+                    open_books.add(isbn)
+                    open_per_card[card_id] = open_per_card.get(card_id, 0) + 1
+                    date_in = None
+            loan_id += 1
+            yield (
+                loan_id,
+                isbn,
+                card_id,
+                date_out.isoformat(),
+                (date_out + timedelta(days=LOAN_DAYS)).isoformat(),
+                date_in.isoformat() if date_in else None,
+            )
+
+
+def generate(conn, books: int, borrowers: int, loans: int, years: int = 5,
+             authors: int = None, seed: int = 42, today: date = None) -> None:
+    """Drop and rebuild every table in ``conn`` with synthetic data."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    authors = authors or max(books // 3, 1)
+    with load_data.bulk_load_pragmas(conn):
+        load_data.initialize_schema(conn, with_indexes=False)
+        for label, insert, rows in (
+            ("BOOK", load_data.BOOK_INSERT, _book_rows(rng, books)),
+            ("AUTHORS", load_data.AUTHORS_INSERT, _author_rows(rng, authors)),
+            ("BOOK_AUTHORS", "INSERT OR IGNORE INTO BOOK_AUTHORS(Author_id, Isbn) VALUES (?, ?)",
+             _book_author_rows(rng, books, authors)),
+            ("BORROWER", load_data.BORROWER_INSERT, _borrower_rows(rng, borrowers)),
+            ("BOOK_LOANS",
+             "INSERT INTO BOOK_LOANS(Loan_id, Isbn, Card_id, Date_out, Due_date, Date_in) "
+             "VALUES (?, ?, ?, ?, ?, ?)",
+             _loan_rows(rng, loans, books, borrowers, years, today)),
+        ):
+            start = time.perf_counter()
+            count = load_data.insert_batches(conn, insert, rows)
+            load_data.report_load(label, count, time.perf_counter() - start)
+        conn.commit()
+
+        start = time.perf_counter()
+        written = fines.refresh_fines(conn, today)
+        # Fines on loans returned more than 90 days ago have mostly been paid.
+        conn.execute(
+            """
+            UPDATE FINES SET Paid = 1
+            WHERE Loan_id IN (
+                SELECT Loan_id FROM BOOK_LOANS
+                WHERE Date_in < ? AND Loan_id % 10 < 8
+            )
+            """,
+            ((today - timedelta(days=90)).isoformat(),),
+        )
+        conn.commit()
+        print(f"  {'FINES':<14} {written:>10,} rows in {time.perf_counter() - start:7.2f}s")
+
+        load_data.finish_load(conn)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic library database.")
+    parser.add_argument("--db", type=Path, default=Path("synthetic.db"),
+                        help="database file to (re)create (default synthetic.db)")
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--authors", type=int, help="default: one per three books")
+    parser.add_argument("--borrowers", type=int, default=100_000)
+    parser.add_argument("--loans", type=int, default=3_000_000)
+    parser.add_argument("--years", type=int, default=5, help="years of loan history")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with get_connection(args.db, instrumented=False) as conn:
+        generate(conn, args.books, args.borrowers, args.loans, args.years, args.authors, args.seed)
+    conn.close()
+    print(f"Generated {args.db} in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()